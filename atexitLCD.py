@@ -24,7 +24,7 @@ def _atexit_function():
         return
 
     try:
-        lcd = lcd2usb.LCD()
+        lcd = lcd2usb.LCD.shared()
     except lcd2usb.LCD2USBNotFound:
         return
     except Exception as exc:
@@ -35,18 +35,18 @@ def _atexit_function():
             print("\nCan't clear screen:\n")
             raise
 
-    ver = lcd.version
+    ver = lcd.device_info.version  # cached, no request at exit
 
-    lcd.clear()
     if ver == (-1, -1):
-        lcd.fill_center("LCD2USB's fucked")
+        title = "LCD2USB's fucked"
     else:
-        lcd.fill_center("LCD2USB fw v{}.{}".format(*ver), 0)
+        title = "LCD2USB fw v{}.{}".format(*ver)
 
-    lcd.fill_center("win10py3lcd2usb exit", 2)
-    lcd.fill(_ctime(), 3)
-
-    lcd._flush()
+    # one cursor move and full DATA transfers, see LCD.show()
+    lcd.show(lcd2usb.frame_of(
+        [title, "", "win10py3lcd2usb exit", _ctime()], align='center',
+        geometry=lcd.geometry, charset=lcd.charset))
+    lcd.sync()
 
 
 import atexit as _atexit
@@ -4,7 +4,7 @@ import os
 import os.path
 import logging
 
-__all__ = ('lcd2usb', 'usb1')
+__all__ = ('lcd2usb', 'aiolcd2usb', 'usb1')
 
 logger = logging.getLogger(__name__)
 
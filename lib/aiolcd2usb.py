@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# encoding: utf8
+
+'''asyncio wrapper for LCD2USB
+
+Control transfers are submitted asynchronously and completed from the event
+loop, which watches libusb's pollable file descriptors, so no call blocks the
+loop and no thread is needed.
+'''
+
+import asyncio
+import collections
+import select
+import struct
+import time
+
+import usb1
+
+import lcd2usb
+
+
+POLLIN = getattr(select, 'POLLIN', 0x001)
+POLLOUT = getattr(select, 'POLLOUT', 0x004)
+
+REQUEST_READ_TYPE = lcd2usb.REQUEST_GET_TYPE | usb1.ENDPOINT_IN
+
+
+class LoopSender(object):
+    '''queue of control transfers completed by an asyncio event loop
+
+    Requests are submitted in order with up to `depth` transfers in flight;
+    the rest wait in a queue and are submitted as transfers complete. Has the
+    send/drain/close interface of lcd2usb.AsyncSender, except that drain()
+    returns an awaitable.'''
+
+    def __init__(self, context, device, loop, depth=8, timeout=1000,
+                 stats=None):
+        self.context = context
+        self.loop = loop
+        self.timeout = timeout
+        self.failures = 0
+        self.stats = stats
+
+        self.queue = collections.deque()
+        self.idle = [device.getTransfer() for _ in range(depth)]
+        self.depth = depth
+        self.waiters = []  # futures of drain() calls
+        self.timer = None
+
+        self.fds = {}
+        for fd, events in context.getPollFDList():
+            self._add_fd(fd, events, None)
+        context.setPollFDNotifiers(self._add_fd, self._remove_fd)
+
+    def _add_fd(self, fd, events, _):
+        if events & POLLIN:
+            self.loop.add_reader(fd, self._handle_events)
+        if events & POLLOUT:
+            self.loop.add_writer(fd, self._handle_events)
+        self.fds[fd] = events
+
+    def _remove_fd(self, fd, _):
+        events = self.fds.pop(fd, 0)
+        if events & POLLIN:
+            self.loop.remove_reader(fd)
+        if events & POLLOUT:
+            self.loop.remove_writer(fd)
+
+    def _handle_events(self):
+        '''let libusb handle ready events, which calls _completed'''
+
+        try:
+            self.context.handleEventsTimeout(0)
+        except usb1.USBErrorInterrupted:
+            pass
+        self._schedule_timeout()
+
+    def _schedule_timeout(self):
+        '''make sure libusb handles transfer timeouts in time'''
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        timeout = self.context.getNextTimeout()
+        if timeout is not None:
+            self.timer = self.loop.call_later(timeout, self._handle_events)
+
+    def submit(self, request_type, request, value, index, data_or_length):
+        '''queue a control transfer, returns a future for its data
+
+        The future's result is the data read (b'' for writes) or None if
+        the transfer failed.'''
+
+        future = self.loop.create_future()
+        self.queue.append(
+            (request_type, request, value, index, data_or_length, future))
+        self._submit_next()
+        return future
+
+    def send(self, request, value, index):
+        '''queue a control write, as used by LCD._send'''
+
+        self.submit(lcd2usb.TYPE_VENDOR, request, value, index, b'')
+
+    def _submit_next(self):
+        while self.idle and self.queue:
+            request_type, request, value, index, data_or_length, future = \
+                self.queue.popleft()
+            transfer = self.idle.pop()
+            transfer.setControl(request_type, request, value, index,
+                                data_or_length, callback=self._completed,
+                                user_data=(future, request,
+                                           time.perf_counter()),
+                                timeout=self.timeout)
+            try:
+                transfer.submit()
+            except usb1.libusb1.USBError:
+                print('USB request failed!')
+                self.failures += 1
+                self._record(transfer, 0, failed=True)
+                self.idle.append(transfer)
+                _resolve(future, None)
+        self._schedule_timeout()
+        self._wake_waiters()
+
+    def _record(self, transfer, length, **status):
+        if self.stats is not None:
+            _, request, started = transfer.getUserData()
+            self.stats.record(request, length, time.perf_counter() - started,
+                              **status)
+
+    def _completed(self, transfer):
+        future, request, _ = transfer.getUserData()
+        status = transfer.getStatus()
+        try:
+            if status == usb1.TRANSFER_COMPLETED:
+                data = bytes(transfer.getBuffer()[:transfer.getActualLength()])
+                self._record(transfer, len(data) or
+                             lcd2usb._payload_length(request))
+                _resolve(future, data)
+            else:
+                print('USB request failed!')
+                self.failures += 1
+                self._record(transfer, 0, failed=True,
+                             timed_out=status == usb1.TRANSFER_TIMED_OUT)
+                _resolve(future, None)
+        finally:
+            # always give the transfer back, even if its waiter is gone
+            self.idle.append(transfer)
+            self._submit_next()
+
+    def _wake_waiters(self):
+        if self.queue or len(self.idle) < self.depth:
+            return
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def drain(self):
+        '''awaitable that completes once every queued transfer is done'''
+
+        waiter = self.loop.create_future()
+        self.waiters.append(waiter)
+        self._wake_waiters()
+        return waiter
+
+    def close(self):
+        '''stop watching libusb's file descriptors'''
+
+        self.context.setPollFDNotifiers(None, None)
+        for fd in list(self.fds):
+            self._remove_fd(fd, None)
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        for transfer in self.idle:
+            transfer.close()
+        self.idle = []
+
+
+def _resolve(future, result):
+    '''set the result of a future unless its waiter was cancelled'''
+
+    if not future.done():
+        future.set_result(result)
+
+
+class AsyncLCD(object):
+    '''HD44780 based text LCD display supported with LCD2USB, for asyncio
+
+    Wraps an lcd2usb.LCD whose transfers are sent through a LoopSender.
+    Everything that talks to the device is awaitable.'''
+
+    def __init__(self, lcd=None, loop=None, depth=8):
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.lcd = lcd if lcd is not None else lcd2usb.LCD()
+        transport = lcd2usb.base_transport(self.lcd.transport)
+        if transport.sender is not None:
+            transport.sender.close()
+        self.sender = LoopSender(transport.context, transport.device,
+                                 self.loop, depth, stats=transport.stats)
+        transport.sender = self.sender
+
+    async def sync(self):
+        '''flush the buffer and wait until everything sent has arrived'''
+
+        with self.lcd.lock:
+            self.lcd._flush()
+        await self.sender.drain()
+
+    async def close(self):
+        '''wait for pending transfers and close usb device connection'''
+
+        await self.sync()
+        self.sender.close()
+        lcd2usb.base_transport(self.lcd.transport).sender = None
+        self.lcd.close()
+
+    async def get(self, command):
+        '''get a value from the lcd2usb interface'''
+
+        buf = await self.sender.submit(REQUEST_READ_TYPE, command, 0, 0, 2)
+        if buf is None:
+            return -1
+        ret, = struct.unpack('H', buf)
+        return ret
+
+    async def set(self, command, value):
+        '''set a value in the LCD interface, see LCD.set()'''
+
+        settings = self.lcd.settings
+        if settings.get(command) == value:
+            return 0
+        settings[command] = value
+        if await self.sender.submit(lcd2usb.TYPE_VENDOR, command, value, 0,
+                                    b'') is None:
+            settings.pop(command, None)  # unknown, send it next time
+        return 0
+
+    async def echo(self, value):
+        '''echo test, see LCD.echo'''
+
+        buf = await self.sender.submit(REQUEST_READ_TYPE, lcd2usb.LCD_ECHO,
+                                       value, 0, 2)
+        if buf is None:
+            return -1
+        ret, = struct.unpack('H', buf)
+        return ret
+
+    @property
+    def keys(self):
+        '''state of the two optional buttons (awaitable)'''
+
+        return self._keys()
+
+    async def _keys(self):
+        keymask = await self.get(lcd2usb.LCD_GET_KEYS)
+
+        return bool(keymask & 1), bool(keymask & 2)
+
+    async def key_events(self, interval=0.02, samples=2, long_press=1.0):
+        '''async iterator of debounced KeyEvents, see lcd2usb.KeyPoller
+
+        Polls the buttons every `interval` seconds while iterated.'''
+
+        debouncer = lcd2usb.KeyDebouncer(samples=samples,
+                                         long_press=long_press)
+        deadline = self.loop.time()
+        while True:
+            keymask = await self.get(lcd2usb.LCD_GET_KEYS)
+            if keymask >= 0:
+                for event in debouncer.feed(keymask, self.loop.time()):
+                    yield event
+            deadline = max(deadline + interval, self.loop.time())
+            await asyncio.sleep(deadline - self.loop.time())
+
+    async def set_contrast(self, value):
+        '''set contrast to a value between 0 and 255.'''
+
+        return await self.set(lcd2usb.LCD_SET_CONTRAST, value)
+
+    async def set_brightness(self, value):
+        '''set backlight brightness to a value between 0 (off) and 255'''
+
+        return await self.set(lcd2usb.LCD_SET_BRIGHTNESS, value)
+
+    async def clear(self):
+        '''clear display'''
+
+        self.lcd.clear()
+        await self.sync()
+
+    async def write(self, data, column=None, row=None, ctrl=None):
+        '''write a data string to the display'''
+
+        self.lcd.write(data, column, row, ctrl)
+        await self.sync()
+
+    async def define_char(self, ascii_, data):
+        '''recording custom symbol to the HD44780 memory'''
+
+        self.lcd.define_char(ascii_, data)
+        await self.sync()
+
+    async def fill(self, message, row_index=0, align='left'):
+        '''Fill a row with a message with a given alignment.'''
+
+        self.lcd.fill(message, row_index, align)
+        await self.sync()
+
+    async def fill_center(self, message, row_index=0):
+        '''Fill a row with a message, center-aligned.'''
+
+        await self.fill(message, row_index, align='center')
+
+    async def fill_right(self, message, row_index=0):
+        '''Fill a row with a message, right-aligned.'''
+
+        await self.fill(message, row_index, align='right')
+
+    def begin_frame(self):
+        '''start staging a frame, see LCD.begin_frame()'''
+
+        self.lcd.begin_frame()
+
+    async def commit(self):
+        '''send the staged frame, see LCD.commit()'''
+
+        sent = self.lcd.commit()
+        await self.sync()
+        return sent
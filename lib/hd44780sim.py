@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# encoding: utf8
+
+'''Simulated LCD2USB device with HD44780 controllers
+
+SimulatedTransport decodes the LCD2USB request encoding and models the
+display memory of the controllers behind it, so the lcd2usb driver can be
+run, checked and measured without hardware:
+
+    lcd = lcd2usb.LCD(transport=hd44780sim.SimulatedTransport())
+    lcd.hello()
+    print('\\n'.join(lcd.transport.text()))
+
+mismatches() checks that the driver's model of the display agrees with
+the simulated device.
+'''
+
+import struct
+import threading
+import time
+
+import lcd2usb
+
+
+# rough cost of one control transfer to the low-speed LCD2USB, in seconds:
+# setup and status stage each take a 1 ms bus frame, reads add a data stage
+WRITE_TIME = 0.002
+READ_TIME = 0.003
+
+FIRMWARE_VERSION = (1, 9)
+
+
+class HD44780(object):
+    '''model of one HD44780 controller in two-line mode
+
+    DDRAM holds two lines of 40 characters at 0x00-0x27 and 0x40-0x67,
+    CGRAM holds the 8 custom characters of 8 rows each.'''
+
+    LINE_LENGTH = 40
+
+    def __init__(self):
+        self.ddram = bytearray(b' ' * 0x80)
+        self.cgram = bytearray(64)
+        self.address = 0
+        self.cgram_mode = False
+        self.increment = True  # entry mode I/D
+        self.shift_on_write = False  # entry mode S
+        self.display_on = False
+        self.offset = 0  # display shift, positive is shifted left
+
+    def _move(self, address, forward):
+        '''DDRAM address after moving the cursor one cell'''
+
+        if forward:
+            return lcd2usb._next_address(address)
+        if address == 0x00:
+            return 0x67
+        if address == 0x40:
+            return 0x27
+        return address - 1
+
+    def command(self, command):
+        '''execute an instruction'''
+
+        if command & 0x80:  # set DDRAM address
+            self.address = command & 0x7f
+            self.cgram_mode = False
+        elif command & 0x40:  # set CGRAM address
+            self.address = command & 0x3f
+            self.cgram_mode = True
+        elif command & 0x20:  # function set
+            pass
+        elif command & 0x10:  # cursor or display shift
+            right = bool(command & 0x04)
+            if command & 0x08:
+                self.offset += -1 if right else 1
+            else:
+                self.address = self._move(self.address, right)
+        elif command & 0x08:  # display on/off control
+            self.display_on = bool(command & 0x04)
+        elif command & 0x04:  # entry mode set
+            self.increment = bool(command & 0x02)
+            self.shift_on_write = bool(command & 0x01)
+        elif command & 0x02:  # return home
+            self.address = 0
+            self.cgram_mode = False
+            self.offset = 0
+        elif command & 0x01:  # clear display
+            self.ddram[:] = b' ' * len(self.ddram)
+            self.address = 0
+            self.cgram_mode = False
+            self.increment = True
+            self.offset = 0
+
+    def data(self, value):
+        '''write a byte to DDRAM or CGRAM'''
+
+        if self.cgram_mode:
+            self.cgram[self.address] = value
+            step = 1 if self.increment else -1
+            self.address = (self.address + step) & 0x3f
+            return
+
+        self.ddram[self.address] = value
+        self.address = self._move(self.address, self.increment)
+        if self.shift_on_write:
+            self.offset += 1 if self.increment else -1
+
+    def row(self, address, columns):
+        '''contents of the display row starting at a DDRAM address'''
+
+        line = address & 0x40
+        start = address - line + self.offset
+        return bytes(self.ddram[line + (start + column) % self.LINE_LENGTH]
+                     for column in range(columns))
+
+
+class SimulatedTransport(object):
+    '''in-memory LCD2USB device, usable as transport of lcd2usb.LCD
+
+    Records transfers in its TransferStats like a real transport, with the
+    bus time they would take as latency. With realtime set, each transfer
+    also takes that long, and transfers from several threads take turns
+    like control transfers to a real device.'''
+
+    def __init__(self, controllers=1, realtime=False,
+                 write_time=WRITE_TIME, read_time=READ_TIME):
+        self.controllers = [HD44780() for _ in range(controllers)]
+        self.realtime = realtime
+        self.write_time = write_time
+        self.read_time = read_time
+
+        self.contrast = 0
+        self.brightness = 0
+        self.keymask = 0  # state of the two buttons, set it to press them
+        self.stats = lcd2usb.TransferStats()
+        self.bus = threading.Lock()
+
+    def reset_counters(self):
+        '''start counting transfers and bus time from zero'''
+
+        self.stats.reset()
+
+    @property
+    def transfers(self):
+        '''number of transfers so far'''
+
+        return self.stats.transfers
+
+    @property
+    def bus_time(self):
+        '''simulated time spent on the bus so far, in seconds'''
+
+        return sum(counters['seconds']
+                   for counters in self.stats.snapshot().values())
+
+    def _count(self, request, length, seconds):
+        self.stats.record(request, length, seconds)
+        if self.realtime:
+            with self.bus:
+                time.sleep(seconds)
+
+    def _targets(self, request):
+        if request & lcd2usb.LCD_CTRL_0:
+            yield self.controllers[0]
+        if request & lcd2usb.LCD_CTRL_1 and len(self.controllers) > 1:
+            yield self.controllers[1]
+
+    def write(self, request, value=0, index=0):
+        '''decode and execute a control request'''
+
+        self._count(request, lcd2usb._payload_length(request),
+                    self.write_time)
+        kind = request & 0xe0
+        if kind in (lcd2usb.LCD_CMD, lcd2usb.LCD_DATA):
+            length = (request & 0x03) + 1
+            payload = struct.pack('<HH', value, index)[:length]
+            for controller in self._targets(request):
+                for byte in payload:
+                    if kind == lcd2usb.LCD_CMD:
+                        controller.command(byte)
+                    else:
+                        controller.data(byte)
+        elif request == lcd2usb.LCD_SET_CONTRAST:
+            self.contrast = value & 0xff
+        elif request == lcd2usb.LCD_SET_BRIGHTNESS:
+            self.brightness = value & 0xff
+
+    def read(self, request, value=0, index=0, length=2):
+        '''answer a control request'''
+
+        self._count(request, length, self.read_time)
+        if request == lcd2usb.LCD_ECHO:
+            answer = value
+        elif request == lcd2usb.LCD_GET_FWVER:
+            answer = FIRMWARE_VERSION[0] | (FIRMWARE_VERSION[1] << 8)
+        elif request == lcd2usb.LCD_GET_KEYS:
+            answer = self.keymask
+        elif request == lcd2usb.LCD_GET_CTRL:
+            answer = (1 << len(self.controllers)) - 1
+        else:
+            answer = 0
+        return struct.pack('<H', answer)[:length]
+
+    def sync(self):
+        '''nothing is ever pending'''
+
+    def close(self):
+        '''nothing to close'''
+
+    def location(self):
+        '''bus number and device address'''
+
+        return 0, 0
+
+    def text(self, geometry=lcd2usb.DEFAULT_GEOMETRY):
+        '''the rows shown by a display of the given geometry, as strings'''
+
+        return [self.controllers[geometry.controller(row)].row(
+                    address, geometry.columns).decode('latin-1')
+                for row, address in enumerate(geometry.row_addresses)]
+
+
+def mismatches(lcd):
+    '''differences between the display contents and address counters
+    modelled by an LCD and those of the SimulatedTransport behind it, as
+    messages, empty if they agree'''
+
+    transport = lcd2usb.base_transport(lcd.transport)
+    geometry = lcd.geometry
+    found = []
+    if lcd.shadow_valid:
+        for row, address in enumerate(geometry.row_addresses):
+            # the shadow holds the contents at display shift 0
+            controller = transport.controllers[geometry.controller(row)]
+            shown = bytes(controller.ddram[address:address + geometry.columns])
+            modelled = bytes(geometry.row(lcd.shadow, row))
+            if shown != modelled:
+                found.append('row %d holds %r, the shadow %r'
+                             % (row, shown, modelled))
+    for index, address in enumerate(lcd.addresses):
+        controller = transport.controllers[index]
+        if address is None or lcd.cgram_modes[index]:
+            continue  # not modelled
+        if controller.cgram_mode or controller.address != address:
+            found.append('address counter %d is 0x%02x%s, modelled 0x%02x'
+                         % (index, controller.address,
+                            ' in CGRAM' if controller.cgram_mode else '',
+                            address))
+    return found
@@ -4,9 +4,32 @@
 '''Python wrapper for LCD2USB
 '''
 
+import bisect
+import codecs
+import collections
+import contextlib
+import functools
+import logging
 import struct
+import threading
+import time
+import unicodedata
+import weakref
 
-import usb1
+try:
+    import usb1
+except (ImportError, OSError):
+    # no python-libusb1 or no libusb-1.0 library, only simulated transports
+    # (see hd44780sim) can be used
+    usb1 = None
+    USBError = IOError
+    USBErrorTimeout = IOError
+else:
+    USBError = usb1.USBError
+    USBErrorTimeout = usb1.USBErrorTimeout
+
+
+logger = logging.getLogger(__name__)
 
 
 # vendor and product id
@@ -24,6 +47,13 @@ LCD_DATA = 2 << 5
 LCD_SET = 3 << 5
 LCD_GET = 4 << 5
 
+REQUEST_NAMES = {LCD_ECHO: 'ECHO',
+                 LCD_CMD: 'CMD',
+                 LCD_DATA: 'DATA',
+                 LCD_SET: 'SET',
+                 LCD_GET: 'GET',
+                 }
+
 # target is value to set
 LCD_SET_CONTRAST = LCD_SET | (0 << 3)
 LCD_SET_BRIGHTNESS = LCD_SET | (1 << 3)
@@ -36,12 +66,193 @@ LCD_GET_KEYS = LCD_GET | (1 << 3)
 LCD_GET_CTRL = LCD_GET | (2 << 3)
 LCD_GET_RESERVED1 = LCD_GET | (3 << 3)
 
+# default display geometry (20x4) and the DDRAM address of each row's first
+# cell, see GEOMETRIES for other displays
+LCD_COLUMNS = 20
+LCD_ROWS = 4
+ROW_ADDRESSES = (0x00, 0x40, 0x14, 0x54)
+
+# in two-line mode the HD44780 address counter runs 0x00-0x27 and
+# 0x40-0x67, wrapping from the end of one line to the start of the other
+DDRAM_WRAP = {0x28: 0x40, 0x68: 0x00}
+LINE_LENGTH = 0x28  # cells per DDRAM line, display shifts rotate within it
+
+# when committing a frame, runs of changed cells separated by at most this
+# many unchanged cells are sent as one run (rewriting a few unchanged cells
+# is cheaper than an additional cursor move)
+FRAME_MERGE_GAP = 4
+
+# number of compiled frames kept by each LCD, see LCD.show()
+PROGRAM_CACHE_SIZE = 16
+
+# upper bounds (in seconds) of the transfer latency histogram buckets, the
+# last bucket counts everything slower
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2,
+                   0.5, 1.0)
+
+# failure policy of ResilientTransport: timeout of each attempt in ms,
+# retries of a failed transfer with exponential backoff starting at
+# RETRY_BACKOFF seconds, consecutive failed transfers opening the circuit,
+# and seconds between echo probes while it is open
+TRANSFER_TIMEOUT = 100
+RETRIES = 2
+RETRY_BACKOFF = 0.005
+BREAKER_THRESHOLD = 3
+PROBE_INTERVAL = 1.0
+
+# repaints LCD.resync() makes in a row while transfers keep being retried
+# during them, the next draw() tries again after that
+RESYNC_LIMIT = 3
+
+# most transfers per second sent by a Fader
+FADE_RATE = 25
+
+# kinds of KeyEvents
+KEY_PRESS = 'press'
+KEY_RELEASE = 'release'
+KEY_LONG_PRESS = 'long press'
+
 # custom symbols
 SMILE_SYMBOL = bytearray([0x00, 0x0a, 0x0a, 0x00, 0x11, 0x0e, 0x00, 0x00])
 
 
-TYPE_VENDOR = usb1.libusb1.LIBUSB_TYPE_VENDOR
-REQUEST_GET_TYPE = TYPE_VENDOR | usb1.libusb1.LIBUSB_RECIPIENT_DEVICE
+# usb1.TYPE_VENDOR and usb1.RECIPIENT_DEVICE
+TYPE_VENDOR = 0x02 << 5
+REQUEST_GET_TYPE = TYPE_VENDOR | 0x00
+# usb1.ENDPOINT_IN, set in the request type of reads
+ENDPOINT_IN = 0x80
+
+# transfer trace files, see TraceTransport: a header, then one record per
+# transfer of time.time() timestamp, request type, request, value, index,
+# data read (0 for writes), length read and status (0 or TRACE_FAILED)
+TRACE_MAGIC = b'LCD2USB-TRACE\x00\x01\x00'
+TRACE_RECORD = struct.Struct('<dBBHHHBb')
+TRACE_FAILED = -1
+
+
+def _next_address(address):
+    '''DDRAM address the HD44780 moves to after writing at address'''
+
+    address += 1
+    return DDRAM_WRAP.get(address, address)
+
+
+def _advance(address, count):
+    '''DDRAM address the HD44780 moves to after writing count cells from
+    address, wrapping between the lines as often as needed'''
+
+    while count:
+        step = min(count, (0x28 if address < 0x40 else 0x68) - address)
+        address = DDRAM_WRAP.get(address + step, address + step)
+        count -= step
+    return address
+
+
+class Geometry(collections.namedtuple(
+        'Geometry', 'columns rows row_addresses row_targets')):
+    '''size of a display and where its rows live
+
+    row_addresses holds the DDRAM address of the first cell of each row,
+    row_targets the controller showing it: LCD_BOTH on single controller
+    displays, LCD_CTRL_0 or LCD_CTRL_1 on dual controller ones. Cells are
+    numbered row by row, as in frames and LCD.shadow.'''
+
+    __slots__ = ()
+
+    @property
+    def cells(self):
+        '''number of cells'''
+
+        return self.columns * self.rows
+
+    @property
+    def controllers(self):
+        '''number of controllers'''
+
+        return 2 if LCD_CTRL_1 in self.row_targets else 1
+
+    def controller(self, row):
+        '''index of the controller showing a row'''
+
+        return 1 if self.row_targets[row] == LCD_CTRL_1 else 0
+
+    def targets(self, ctrl):
+        '''indices of the controllers a CMD/DATA target bit map reaches'''
+
+        if self.controllers == 1:
+            return (0,) if ctrl & LCD_BOTH else ()
+        return tuple(controller for controller, bit
+                     in enumerate((LCD_CTRL_0, LCD_CTRL_1)) if ctrl & bit)
+
+    def row(self, cells, row):
+        '''slice one row out of a frame or shadow'''
+
+        return cells[row * self.columns:(row + 1) * self.columns]
+
+    def cell(self, controller, address):
+        '''index of the cell showing a DDRAM address of a controller, or
+        None if it is not shown'''
+
+        for row, row_address in enumerate(self.row_addresses):
+            column = address - row_address
+            if 0 <= column < self.columns and \
+                    self.controller(row) == controller:
+                return row * self.columns + column
+        return None
+
+    def segment(self, controller, address):
+        '''(cell, length) of the run of consecutive cells starting at a DDRAM
+        address, cell is None for a run of addresses not shown'''
+
+        length = (0x28 if address < 0x40 else 0x68) - address  # until wrap
+        cell = self.cell(controller, address)
+        if cell is not None:
+            return cell, min(length, self.columns - cell % self.columns)
+        for row, row_address in enumerate(self.row_addresses):
+            if address < row_address < address + length and \
+                    self.controller(row) == controller:
+                length = row_address - address
+        return None, length
+
+    def chains(self):
+        '''group the rows of each controller whose DDRAM addresses follow
+        each other
+
+        Writing past the end of a row continues at the start of the next row
+        in its chain (on a 20x4 display rows 0, 2, 1 and 3 in this order), so
+        a chain can be updated as one run without cursor moves.'''
+
+        return _chains(self)
+
+
+@functools.lru_cache()
+def _chains(geometry):
+    chains = []
+    rows = sorted(range(geometry.rows), key=lambda row: (
+        geometry.controller(row), geometry.row_addresses[row]))
+    for row in rows:
+        address = geometry.row_addresses[row]
+        if chains:
+            last = chains[-1][-1]
+            end = geometry.row_addresses[last] + geometry.columns
+            if geometry.controller(last) == geometry.controller(row) and \
+                    DDRAM_WRAP.get(end, end) == address:
+                chains[-1].append(row)
+                continue
+        chains.append([row])
+    return tuple(tuple(chain) for chain in chains)
+
+
+GEOMETRIES = {
+    '16x2': Geometry(16, 2, (0x00, 0x40), (LCD_BOTH,) * 2),
+    '16x4': Geometry(16, 4, (0x00, 0x40, 0x10, 0x50), (LCD_BOTH,) * 4),
+    '20x2': Geometry(20, 2, (0x00, 0x40), (LCD_BOTH,) * 2),
+    '20x4': Geometry(20, 4, ROW_ADDRESSES, (LCD_BOTH,) * 4),
+    '40x2': Geometry(40, 2, (0x00, 0x40), (LCD_BOTH,) * 2),
+    '40x4': Geometry(40, 4, (0x00, 0x40, 0x00, 0x40),
+                     (LCD_CTRL_0, LCD_CTRL_0, LCD_CTRL_1, LCD_CTRL_1)),
+}
+DEFAULT_GEOMETRY = GEOMETRIES['20x4']
 
 
 class LCD2USBNotFound(Exception):
@@ -51,27 +262,876 @@ class LCD2USBNotFound(Exception):
         return 'Cound not find LCD2USB device.'
 
 
-def find():
+class CircuitOpen(USBError):
+    '''transfer not attempted, the device stopped answering'''
+
+    def __str__(self):
+        return 'USB link down'
+
+
+def _changed_runs(old, new, merge_gap=FRAME_MERGE_GAP):
+    '''list (start, end) runs of cells that differ between old and new'''
+
+    runs = []
+    for i, (before, after) in enumerate(zip(old, new)):
+        if before == after:
+            continue
+        if runs and i - runs[-1][1] <= merge_gap:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return runs
+
+
+def _fill_row(message, align='left', size=LCD_COLUMNS):
+    '''pad or truncate a message to a full row with a given alignment'''
+
+    if not isinstance(message, str):
+        message = str(message)
+    if len(message) > size:
+        return message[:size]
+    if align == 'center':
+        return message.center(size)
+    elif align == 'right':
+        return message.rjust(size)
+    return message.ljust(size)
+
+
+# character codes not in a ROM table
+_UNDEFINED = '\ufffe'
+
+
+def _rom_table(upper, cgram=8, low=''):
+    '''decoding table of a character ROM: CGRAM at 0x00-0x07, ASCII-like
+    low half patched by low (code:char), upper half from 0x80'''
+
+    table = [chr(code) for code in range(cgram)]
+    table += [_UNDEFINED] * (0x20 - cgram)
+    table += [chr(code) for code in range(0x20, 0x80)]
+    for code, char in low.items():
+        table[code] = char
+    table += upper
+    assert len(table) == 256
+    return ''.join(table)
+
+
+# HD44780UA00, Japanese standard font: katakana and some Greek letters and
+# symbols; lookalikes of ASCII characters (such as g with a longer descender)
+# and glyphs without Unicode equivalent are left undefined
+ROM_A00 = _rom_table(
+    [_UNDEFINED] * 0x21 +
+    [chr(code) for code in range(0xff61, 0xffa0)] +  # halfwidth katakana
+    list('\u03b1\u00e4\u03b2\u03b5\u03bc\u03c3\u03c1\ufffe'
+         '\u221a\ufffe\ufffe\ufffe\u00a2\ufffe\u00f1\u00f6'
+         '\ufffe\ufffe\u03b8\u221e\u03a9\u00fc\u03a3\u03c0'
+         '\ufffe\ufffe\u5343\u4e07\u5186\u00f7\ufffe\u2588'),
+    low={0x5c: '\u00a5', 0x7e: '\u2192', 0x7f: '\u2190'})
+
+# HD44780UA02, European standard font: its upper half follows ISO 8859-1,
+# the Cyrillic and Greek letters and symbols at 0x10-0x1f and 0x80-0x9f are
+# left undefined
+ROM_A02 = _rom_table(
+    [_UNDEFINED] * 0x20 + [chr(code) for code in range(0xa0, 0x100)],
+    low={0x7f: '\u2302'})
+
+# replacements of characters a ROM lacks with ones it has, one character
+# each so that texts keep their length; accented Latin letters also fall back
+# to their base letters, see Charset
+_TRANSLATIONS = {
+    '\u00a0': ' ', '\u2018': "'", '\u2019': "'", '\u201a': "'",
+    '\u2032': "'", '\u201c': '"', '\u201d': '"', '\u201e': '"',
+    '\u2033': '"', '\u2010': '-', '\u2013': '-', '\u2014': '-',
+    '\u2212': '-', '\u00d7': 'x', '\u2126': '\u03a9',
+}
+TRANSLATIONS_A00 = dict(_TRANSLATIONS, **{
+    '\u00b0': '\uff9f',  # degree sign, the semi-voiced mark looks like it
+    '\u00b5': '\u03bc', '\u00df': '\u03b2', '\u00b7': '\uff65',
+})
+TRANSLATIONS_A02 = dict(_TRANSLATIONS, **{
+    '\u03bc': '\u00b5', '\u03b2': '\u00df',
+})
+
+# custom characters drawn in CGRAM for characters a ROM lacks
+FALLBACKS_A00 = {
+    '\\': bytes([0x00, 0x10, 0x08, 0x04, 0x02, 0x01, 0x00, 0x00]),
+    '~': bytes([0x00, 0x00, 0x08, 0x15, 0x02, 0x00, 0x00, 0x00]),
+    '\u00c4': bytes([0x0a, 0x00, 0x0e, 0x11, 0x1f, 0x11, 0x11, 0x00]),
+    '\u00d6': bytes([0x0a, 0x00, 0x0e, 0x11, 0x11, 0x11, 0x0e, 0x00]),
+    '\u00dc': bytes([0x0a, 0x00, 0x11, 0x11, 0x11, 0x11, 0x0e, 0x00]),
+    '\u20ac': bytes([0x06, 0x09, 0x1c, 0x08, 0x1c, 0x09, 0x06, 0x00]),
+}
+FALLBACKS_A02 = {
+    '\u20ac': FALLBACKS_A00['\u20ac'],
+}
+
+
+class Charset(object):
+    '''translation of Unicode text to the codes of an HD44780 character ROM
+
+    Text is encoded with one charmap_encode() call against a precompiled
+    encoding map; only text containing characters missing from the ROM is
+    translated first, with a str.translate() map precomputed from
+    translations and from the base letters of accented Latin letters.
+    Characters still missing become '?', or custom characters through
+    LCD.encode() if fallbacks has a pattern for them. Every character
+    encodes to exactly one byte.'''
+
+    def __init__(self, name, rom, translations, fallbacks):
+        self.name = name
+        self.decoding_table = rom
+        self.encoding_table = codecs.charmap_build(rom)
+        self.fallbacks = fallbacks
+
+        translation = {}
+        for code in range(0xa0, 0x250):
+            char = chr(code)
+            if char in rom or char in fallbacks:
+                continue
+            base = unicodedata.normalize('NFD', char)[0]
+            if base != char and ord(base) < 0x80 and base in rom:
+                translation[code] = base
+        translation.update(str.maketrans(translations))
+        self.translation = translation
+
+    def encode(self, text, errors='replace'):
+        '''bytes of the ROM codes showing text, without custom characters'''
+
+        try:
+            return codecs.charmap_encode(text, 'strict',
+                                         self.encoding_table)[0]
+        except UnicodeEncodeError:
+            return codecs.charmap_encode(text.translate(self.translation),
+                                         errors, self.encoding_table)[0]
+
+    def decode(self, data, errors='replace'):
+        '''text shown by ROM codes'''
+
+        return codecs.charmap_decode(bytes(data), errors,
+                                     self.decoding_table)[0]
+
+    def codec_info(self):
+        '''CodecInfo for codecs.register(), see _search_codec()'''
+
+        def encode(text, errors='strict'):
+            return (codecs.charmap_encode(text.translate(self.translation),
+                                          errors, self.encoding_table)[0],
+                    len(text))
+
+        def decode(data, errors='strict'):
+            return codecs.charmap_decode(data, errors, self.decoding_table)
+
+        return codecs.CodecInfo(encode, decode, name=self.name)
+
+    def __repr__(self):
+        return '<Charset %s>' % self.name
+
+
+CHARSETS = {
+    'A00': Charset('hd44780-a00', ROM_A00, TRANSLATIONS_A00, FALLBACKS_A00),
+    'A02': Charset('hd44780-a02', ROM_A02, TRANSLATIONS_A02, FALLBACKS_A02),
+}
+DEFAULT_CHARSET = CHARSETS['A00']
+
+
+def _search_codec(name):
+    '''make the charsets available as codecs 'hd44780-a00' and
+    'hd44780-a02', e.g. for str.encode()'''
+
+    for charset in CHARSETS.values():
+        if name.replace('-', '_') == charset.name.replace('-', '_'):
+            return charset.codec_info()
+    return None
+
+
+codecs.register(_search_codec)
+
+
+def frame_of(rows, align='left', geometry=DEFAULT_GEOMETRY,
+             charset=DEFAULT_CHARSET):
+    '''frame (one byte per cell) showing a message in each row'''
+
+    rows = list(rows) + [''] * (geometry.rows - len(rows))
+    return charset.encode(''.join(_fill_row(row, align, geometry.columns)
+                                  for row in rows))
+
+
+# a frame compiled into the control transfers that paint it, see
+# LCD.compile(): transfers is a tuple of (request, value, index), address
+# holds where the address counter of each controller ends up
+Program = collections.namedtuple('Program', 'transfers frame address')
+
+# a debounced button event: key is 0 or 1, kind one of KEY_PRESS,
+# KEY_RELEASE and KEY_LONG_PRESS, time a time.monotonic() timestamp and
+# duration how long the key has been held (0 for presses)
+KeyEvent = collections.namedtuple('KeyEvent', 'key kind time duration')
+
+
+_context = None
+_context_lock = threading.Lock()
+
+
+def shared_context():
+    '''the usb1.USBContext shared by the whole process'''
+
+    global _context
+    with _context_lock:
+        if _context is None and usb1 is not None:
+            _context = usb1.USBContext()
+        return _context
+
+
+def find(context=None):
     '''find LCD2USB device'''
 
-    context = usb1.USBContext()
+    if usb1 is None:
+        return None
+    if context is None:
+        context = shared_context()
     handle = context.openByVendorIDAndProductID(LCD2USB_VENDOR_ID,
                                                 LCD2USB_PRODUCT_ID)
     return handle
 
 
-class LCD(object):
-    '''HD44780 based text LCD display supported with LCD2USB'''
+def find_all(context=None):
+    '''find all LCD2USB devices, as usb1.USBDevice instances'''
+
+    if usb1 is None:
+        return []
+    if context is None:
+        context = shared_context()
+    return [device for device in context.getDeviceIterator(skip_on_error=True)
+            if device.getVendorID() == LCD2USB_VENDOR_ID and
+            device.getProductID() == LCD2USB_PRODUCT_ID]
+
+
+def device_path(device):
+    '''bus and port path of a usb1.USBDevice, e.g. "1-2.4"'''
+
+    ports = '.'.join(str(port) for port in device.getPortNumberList())
+    return '%d-%s' % (device.getBusNumber(), ports)
+
+
+def _payload_length(request, read_length=0):
+    '''number of data bytes a request carries'''
+
+    kind = request & 0xe0
+    if kind in (LCD_CMD, LCD_DATA):
+        return (request & 0x03) + 1
+    if kind == LCD_SET:
+        return 1
+    return read_length
+
+
+class TransferStats(object):
+    '''counters and latency histograms of control transfers
+
+    Kept per request type (see REQUEST_NAMES) by the transports; LCD.stats
+    gives access to them. snapshot() returns everything as plain dicts and
+    lists for logging or export.'''
 
     def __init__(self):
-        self.device = find()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''start counting from zero'''
+
+        with self.lock:
+            self.types = {name: {'transfers': 0,
+                                 'bytes': 0,
+                                 'failures': 0,
+                                 'timeouts': 0,
+                                 'seconds': 0.0,
+                                 'histogram': [0] * (len(LATENCY_BUCKETS) + 1),
+                                 }
+                          for name in REQUEST_NAMES.values()}
+
+    def record(self, request, length, seconds, failed=False,
+               timed_out=False):
+        '''count one transfer of a request carrying length bytes'''
+
+        counters = self.types[REQUEST_NAMES.get(request & 0xe0, 'ECHO')]
+        with self.lock:
+            counters['transfers'] += 1
+            counters['bytes'] += length
+            counters['seconds'] += seconds
+            counters['histogram'][
+                bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            if failed or timed_out:
+                counters['failures'] += 1
+            if timed_out:
+                counters['timeouts'] += 1
+
+    def snapshot(self):
+        '''copy of all counters, by request type name'''
+
+        with self.lock:
+            return {name: dict(counters, histogram=list(counters['histogram']))
+                    for name, counters in self.types.items()}
+
+    @property
+    def transfers(self):
+        '''total number of transfers'''
+
+        return sum(counters['transfers'] for counters in self.types.values())
+
+    def summary(self):
+        '''one line of transfer counts, failures and average latency'''
+
+        parts = []
+        for name, counters in sorted(self.snapshot().items()):
+            if not counters['transfers']:
+                continue
+            parts.append('%s %d (%d failed, %.2f ms avg)' % (
+                name, counters['transfers'], counters['failures'],
+                1000 * counters['seconds'] / counters['transfers']))
+        return ', '.join(parts) or 'no transfers'
+
+
+class GlyphCache(object):
+    '''bookkeeping of the custom characters resident in CGRAM
+
+    Maps character patterns (characters.Char or any 8 bytes) to the slots
+    holding them and tracks their use, so the least recently used slot can
+    be given to a new pattern when all slots are taken.'''
+
+    def __init__(self, slots=8):
+        self.patterns = [None] * slots  # pattern held by each slot
+        self.lru = collections.OrderedDict()  # pattern -> slot, LRU first
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, pattern):
+        '''slot holding pattern (marking it as used) or None'''
+
+        slot = self.lru.get(pattern)
+        if slot is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.lru.move_to_end(pattern)
+        return slot
+
+    def victim(self, shown=()):
+        '''slot to reuse for a new pattern
+
+        Slots in `shown`, whose codes are on the display, are taken only if
+        all slots are, as replacing their pattern changes the cells showing
+        them.'''
+
+        for visible in (False, True):
+            for slot, pattern in enumerate(self.patterns):
+                # free, or holding a pattern that is resident elsewhere too
+                if (slot in shown) == visible and \
+                        (pattern is None or self.lru.get(pattern) != slot):
+                    return slot
+            for slot in self.lru.values():
+                if (slot in shown) == visible:
+                    return slot
+
+    def assign(self, slot, pattern):
+        '''record that slot now holds pattern'''
+
+        old = self.patterns[slot]
+        if old is not None and self.lru.get(old) == slot:
+            del self.lru[old]
+        self.patterns[slot] = pattern
+        self.lru[pattern] = slot
+        self.lru.move_to_end(pattern)
+
+    def clear(self):
+        '''forget everything, e.g. when CGRAM contents are unknown'''
+
+        self.patterns = [None] * len(self.patterns)
+        self.lru.clear()
+
+
+class AsyncSender(object):
+    '''pipeline of asynchronous control writes
+
+    Keeps up to `depth` control transfers in flight instead of waiting for
+    every transfer to complete. Control transfers to a device are executed
+    in submission order, so the HD44780 still sees the command stream in the
+    order it was sent. Completions are handled by an event thread.'''
+
+    def __init__(self, context, device, depth=8, timeout=1000, stats=None):
+        self.context = context
+        self.timeout = timeout
+        self.failures = 0
+        self.stats = stats
+
+        self.idle = []
+        for _ in range(depth):
+            transfer = device.getTransfer()
+            helper = usb1.USBTransferHelper()
+            helper.setEventCallback(usb1.TRANSFER_COMPLETED, self._completed)
+            helper.setDefaultCallback(self._failed)
+            transfer.setCallback(helper)
+            self.idle.append(transfer)
+        self.depth = depth
+        self.condition = threading.Condition()
+
+        self.running = True
+        self.thread = threading.Thread(target=self._handle_events,
+                                       name='lcd2usb-events')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _handle_events(self):
+        '''run libusb event handling, which calls the completion callbacks'''
+
+        while self.running:
+            try:
+                self.context.handleEventsTimeout(0.1)
+            except usb1.USBErrorInterrupted:
+                pass
+
+    def _release(self, transfer):
+        with self.condition:
+            self.idle.append(transfer)
+            self.condition.notify_all()
+
+    def _record(self, transfer, **status):
+        if self.stats is not None:
+            request, started = transfer.getUserData()
+            self.stats.record(request, _payload_length(request),
+                              time.perf_counter() - started, **status)
+
+    def _completed(self, transfer):
+        self._record(transfer)
+        self._release(transfer)
+        return False  # do not resubmit
+
+    def _failed(self, transfer):
+        self.failures += 1
+        print('USB request failed!')
+        self._record(transfer, failed=True, timed_out=(
+            transfer.getStatus() == usb1.TRANSFER_TIMED_OUT))
+        self._release(transfer)
+        return False
+
+    def send(self, request, value, index):
+        '''submit a control write, waiting only if the pipeline is full'''
+
+        with self.condition:
+            while not self.idle:
+                self.condition.wait()
+            transfer = self.idle.pop()
+
+        transfer.setControl(TYPE_VENDOR, request, value, index, b'',
+                            callback=transfer.getCallback(),
+                            user_data=(request, time.perf_counter()),
+                            timeout=self.timeout)
+        try:
+            transfer.submit()
+        except USBError:
+            self._record(transfer, failed=True)
+            self._release(transfer)
+            raise
+
+    def drain(self):
+        '''wait until all submitted transfers have completed'''
+
+        with self.condition:
+            while len(self.idle) < self.depth:
+                self.condition.wait()
+
+    def close(self):
+        '''wait for pending transfers and stop the event thread'''
+
+        self.drain()
+        self.running = False
+        self.thread.join()
+        for transfer in self.idle:
+            transfer.close()
+        self.idle = []
+
+
+class USBTransport(object):
+    '''transport to a LCD2USB device over libusb
+
+    A transport carries the LCD2USB control requests: write() sends a
+    request with its value and index, read() returns the data a request
+    answers with. Both raise USBError on failure. See hd44780sim for a
+    simulated transport.'''
+
+    def __init__(self, async_depth=0, timeout=1000, context=None,
+                 device=None):
+        if context is None:
+            context = shared_context()
+        self.context = context
+        # open the given usb1.USBDevice or the first one found
+        self.device = find(context) if device is None else device.open()
         if not self.device:
             raise LCD2USBNotFound()
+        self.timeout = timeout
+        self.stats = TransferStats()
 
-        self.ctrl0, self.ctrl1 = {0: (False, False),
-                                  1: (True, False),
-                                  2: (True, True),
-                                  }.get(self._get_controller())
+        # with async_depth > 0 writes are pipelined, see AsyncSender
+        self.async_depth = async_depth
+        self.sender = None
+        if async_depth:
+            self.sender = AsyncSender(self.context, self.device, async_depth,
+                                      timeout, self.stats)
+
+    def write(self, request, value=0, index=0):
+        '''send a control request'''
+
+        if self.sender is not None:
+            self.sender.send(request, value, index)
+            return
+
+        started = time.perf_counter()
+        try:
+            self.device.controlWrite(TYPE_VENDOR, request, value, index, b'',
+                                     self.timeout)
+        except USBError as exc:
+            self.stats.record(request, _payload_length(request),
+                              time.perf_counter() - started, failed=True,
+                              timed_out=isinstance(exc, USBErrorTimeout))
+            raise
+        self.stats.record(request, _payload_length(request),
+                          time.perf_counter() - started)
+
+    def read(self, request, value=0, index=0, length=2):
+        '''send a control request and return the data read'''
+
+        started = time.perf_counter()
+        try:
+            data = self.device.controlRead(REQUEST_GET_TYPE, request, value,
+                                           index, length, self.timeout)
+        except USBError as exc:
+            self.stats.record(request, 0, time.perf_counter() - started,
+                              failed=True,
+                              timed_out=isinstance(exc, USBErrorTimeout))
+            raise
+        self.stats.record(request, len(data), time.perf_counter() - started)
+        return data
+
+    def sync(self):
+        '''wait until everything written has arrived'''
+
+        if self.sender is not None:
+            self.sender.drain()
+
+    def close(self):
+        '''close usb device connection'''
+
+        if self.sender is not None:
+            self.sender.close()
+            self.sender = None
+        self.device.close()
+
+    def location(self):
+        '''bus number and device address'''
+
+        device = self.device.getDevice()
+        return device.getBusNumber(), device.getDeviceAddress()
+
+    def serial(self):
+        '''serial number of the device, or None if it has none'''
+
+        # read through the open handle, USBDevice.getSerialNumber() would
+        # open the device a second time, which WinUSB may refuse
+        index = self.device.getDevice().device_descriptor.iSerialNumber
+        if not index:
+            return None
+        try:
+            return self.device.getASCIIStringDescriptor(index)
+        except USBError:
+            return None
+
+    def reopen(self, device=None):
+        '''drop the device handle, e.g. of an unplugged device, and open the
+        given usb1.USBDevice or the first one found'''
+
+        try:
+            if self.sender is not None:
+                self.sender.close()
+            self.device.close()
+        except USBError:
+            pass  # gone already
+        self.sender = None
+
+        self.device = find(self.context) if device is None else device.open()
+        if not self.device:
+            raise LCD2USBNotFound()
+        if self.async_depth:
+            self.sender = AsyncSender(self.context, self.device,
+                                      self.async_depth, self.timeout,
+                                      self.stats)
+
+
+# facts about an opened device, read once by LCD.refresh(): firmware
+# version as (major, minor) or (-1, -1), bit mask of the LCD controllers
+# (-1 if unknown), bus number, device address and serial number (or None)
+DeviceInfo = collections.namedtuple(
+    'DeviceInfo', 'version controllers bus address serial')
+
+
+# one transfer of a trace file, see TRACE_RECORD
+TraceRecord = collections.namedtuple(
+    'TraceRecord', 'time request_type request value index data length status')
+
+
+def read_trace(path):
+    '''iterate over the TraceRecords of a trace file'''
+
+    with open(path, 'rb') as trace:
+        if trace.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError('%s is not an LCD2USB trace' % path)
+        while True:
+            record = trace.read(TRACE_RECORD.size)
+            if len(record) < TRACE_RECORD.size:
+                return  # end, or cut off while recording
+            yield TraceRecord._make(TRACE_RECORD.unpack(record))
+
+
+class TraceTransport(object):
+    '''transport appending every transfer of another transport to a trace
+    file, see read_trace() and tools/replay.py
+
+    Everything else is passed through to the traced transport. Writes
+    pipelined by an AsyncSender are recorded when they are queued.'''
+
+    def __init__(self, transport, path):
+        self.transport = transport
+        self.lock = threading.Lock()
+        self.trace = open(path, 'ab')
+        if self.trace.tell() == 0:
+            self.trace.write(TRACE_MAGIC)
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+    def _record(self, request_type, request, value, index, data=b'',
+                status=0):
+        record = TRACE_RECORD.pack(
+            time.time(), request_type, request, value, index,
+            int.from_bytes(data[:2], 'little'), len(data), status)
+        with self.lock:
+            self.trace.write(record)
+
+    def write(self, request, value=0, index=0):
+        '''send and record a control request'''
+
+        try:
+            self.transport.write(request, value, index)
+        except USBError:
+            self._record(TYPE_VENDOR, request, value, index,
+                         status=TRACE_FAILED)
+            raise
+        self._record(TYPE_VENDOR, request, value, index)
+
+    def read(self, request, value=0, index=0, length=2):
+        '''send a control request, record it with the data read'''
+
+        try:
+            data = self.transport.read(request, value, index, length)
+        except USBError:
+            self._record(REQUEST_GET_TYPE | ENDPOINT_IN, request, value,
+                         index, status=TRACE_FAILED)
+            raise
+        self._record(REQUEST_GET_TYPE | ENDPOINT_IN, request, value, index,
+                     bytes(data))
+        return data
+
+    def sync(self):
+        '''wait for the traced transport and write out the trace'''
+
+        self.transport.sync()
+        with self.lock:
+            self.trace.flush()
+
+    def close(self):
+        '''close the traced transport and the trace file'''
+
+        self.transport.close()
+        with self.lock:
+            self.trace.close()
+
+
+class ResilientTransport(object):
+    '''transport retrying failed transfers of another transport, with a
+    circuit breaker
+
+    A failed transfer is retried up to `retries` times with exponential
+    backoff. After `threshold` transfers failed in a row the circuit opens:
+    transfers fail at once with CircuitOpen instead of waiting for timeouts,
+    and every `probe_interval` seconds an echo request checks whether the
+    device answers again. Once it does, needs_resync is set, telling the LCD
+    to repaint the display from its shadow (see LCD.resync()). So does a
+    write that succeeded only when retried, as it may have arrived twice,
+    and a write that failed every attempt, as it may have arrived or not;
+    retried reads change nothing on the display.
+
+    Writes pipelined by an AsyncSender fail after write() returned; they
+    count as failed transfers and set needs_resync when the next transfer
+    sees them, since they are not retried.'''
+
+    def __init__(self, transport, retries=RETRIES, backoff=RETRY_BACKOFF,
+                 threshold=BREAKER_THRESHOLD, probe_interval=PROBE_INTERVAL):
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+
+        self.failures = 0  # transfers failed in a row
+        self.open = False
+        self.next_probe = 0.0
+        self.probes = 0
+        self.needs_resync = False
+        self.sender_failures = 0  # failures of the sender seen so far
+        # totals
+        self.retried = 0
+        self.trips = 0
+        self.rejected = 0
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+    def reset(self):
+        '''close the circuit, e.g. after the device was opened again'''
+
+        self.open = False
+        self.failures = 0
+        sender = getattr(self.transport, 'sender', None)
+        self.sender_failures = 0 if sender is None else sender.failures
+
+    def _failed(self):
+        self.failures += 1
+        if not self.open and self.failures >= self.threshold:
+            logger.warning('USB link down, probing every %g s',
+                           self.probe_interval)
+            self.open = True
+            self.trips += 1
+            self.next_probe = time.monotonic() + self.probe_interval
+
+    def _probe(self):
+        '''whether the device echoes a value again'''
+
+        self.probes = (self.probes + 1) & 0xffff
+        try:
+            data = self.transport.read(LCD_ECHO, self.probes)
+        except USBError:
+            return False
+        return struct.unpack('<H', bytes(data))[0] == self.probes
+
+    def _check(self):
+        '''raise CircuitOpen unless transfers may be attempted'''
+
+        sender = getattr(self.transport, 'sender', None)
+        if sender is not None and sender.failures != self.sender_failures:
+            for _ in range(sender.failures - self.sender_failures):
+                self._failed()
+            self.sender_failures = sender.failures
+            # lost CMD, DATA or SET transfers, repaint and set again
+            self.needs_resync = True
+        if not self.open:
+            return
+        if time.monotonic() >= self.next_probe and self._probe():
+            logger.info('USB link recovered')
+            self.open = False
+            self.failures = 0
+            self.needs_resync = True
+            return
+        self.next_probe = max(self.next_probe,
+                              time.monotonic() + self.probe_interval)
+        self.rejected += 1
+        raise CircuitOpen()
+
+    def _attempt(self, transfer, *args, write=False):
+        self._check()
+        for attempt in range(self.retries + 1):
+            try:
+                result = transfer(*args)
+            except USBError:
+                if attempt == self.retries:
+                    self._failed()
+                    if write:
+                        # the write may or may not have arrived
+                        self.needs_resync = True
+                    raise
+                self.retried += 1
+                time.sleep(self.backoff * 2 ** attempt)
+            else:
+                self.failures = 0
+                if attempt and write:
+                    # the write may have arrived more than once
+                    self.needs_resync = True
+                return result
+
+    def write(self, request, value=0, index=0):
+        '''send a control request, retrying on failure'''
+
+        self._attempt(self.transport.write, request, value, index,
+                      write=True)
+
+    def read(self, request, value=0, index=0, length=2):
+        '''send a control request and return the data read, retrying on
+        failure'''
+
+        return self._attempt(self.transport.read, request, value, index,
+                             length)
+
+
+def base_transport(transport):
+    '''the transport at the bottom of wrapping transports such as
+    TraceTransport and ResilientTransport'''
+
+    while hasattr(transport, 'transport'):
+        transport = transport.transport
+    return transport
+
+
+def _locked(method):
+    '''make a method hold the lock of its LCD or DisplayWriter'''
+
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+class LCD(object):
+    '''HD44780 based text LCD display supported with LCD2USB
+
+    Safe to use from several threads: methods changing the display hold the
+    LCD's lock, and atomic() holds it for a whole group of updates.'''
+
+    # LCDs open on USB, see shared()
+    _open = weakref.WeakSet()
+    _open_lock = threading.Lock()
+
+    def __init__(self, async_depth=0, transport=None,
+                 geometry=None, charset=DEFAULT_CHARSET,
+                 trace=None):
+        resilient = transport is None
+        if transport is None:
+            transport = USBTransport(async_depth, TRANSFER_TIMEOUT)
+        if trace is not None:
+            # record all transfers to this file
+            transport = TraceTransport(transport, trace)
+        if resilient:
+            transport = ResilientTransport(transport)
+        self.transport = transport
+        self.lock = threading.RLock()
+        if isinstance(base_transport(transport), USBTransport):
+            LCD._open.add(self)
+
+        self.refresh()
+
+        # size of the display, a Geometry or a key of GEOMETRIES; without
+        # one, that of the most common display with as many controllers as
+        # the device found
+        if geometry is None:
+            geometry = GEOMETRIES['40x4'] if self.ctrl1 else DEFAULT_GEOMETRY
+        self.geometry = GEOMETRIES.get(geometry, geometry)
+        # character ROM of the controllers, a Charset or a key of CHARSETS
+        self.charset = CHARSETS.get(charset, charset)
+        controllers = self.geometry.controllers
 
         # to increase performance, a little buffer is being used to
         # collect command bytes of the same type before transmitting them
@@ -80,27 +1140,93 @@ class LCD(object):
         self.buffer_current_fill = 0  # -"-
         self.buffer = bytearray(self.BUFFER_MAX_CMD)
 
+        # shadow copy of the display contents, one byte per cell, so frames
+        # can be committed by sending only the cells that changed
+        self.shadow = bytearray(b' ' * self.geometry.cells)
+        self.shadow_valid = False  # display contents unknown until clear()
+        # DDRAM address counter of each controller, None if unknown, and
+        # whether data goes to CGRAM instead of DDRAM
+        self.addresses = [None] * controllers
+        self.cgram_modes = [False] * controllers
+        # display shift of each controller in cells, positive is shifted
+        # left; the shadow holds the contents at shift 0
+        self.shifts = [0] * controllers
+        # controller(s) data is written to, that of the cursor's row
+        self.ctrl = self.geometry.row_targets[0]
+        self.frame = None  # frame being staged, see begin_frame()
+        # (controller, DDRAM address) writes to the staged frame continue
+        # at, None if unknown
+        self.staged_cursor = None
+        self.glyphs = GlyphCache()  # CGRAM contents, see glyph()
+        self.programs = collections.OrderedDict()  # frame -> Program
+        self.settings = {}  # last value set by request, see set()
+        self._resyncing = False
+
+    @property
+    def stats(self):
+        '''transfer statistics of the transport, see TransferStats'''
+
+        return self.transport.stats
+
+    @classmethod
+    def shared(cls, *args, **kwargs):
+        '''an LCD already open in this process, or a newly opened one
+
+        Reuses the open device handle instead of enumerating the bus and
+        probing the controllers again.'''
+
+        with LCD._open_lock:
+            for lcd in list(LCD._open):
+                return lcd
+            return cls(*args, **kwargs)
+
     @classmethod
-    def find_or_die(cls):
+    def find_or_die(cls, *args, **kwargs):
         '''Find and return an LCD or sys.exit'''
         try:
-            return cls()
+            return cls(*args, **kwargs)
         except LCD2USBNotFound as exc:
             print('Error:', exc)
             import sys
             sys.exit(1)
 
+    @_locked
     def close(self):
         '''close usb device connection'''
 
-        self.device.close()
+        LCD._open.discard(self)
+        self.transport.close()
+
+    @_locked
+    def sync(self):
+        '''flush the buffer and wait until everything sent has arrived'''
+
+        self._flush()
+        self.transport.sync()
+
+    def refresh(self):
+        '''read the device facts cached in device_info again, returns the
+        new DeviceInfo'''
+
+        ver = self.get(LCD_GET_FWVER)
+        serial = getattr(self.transport, 'serial', None)
+        self.device_info = DeviceInfo(
+            (ver & 0xff, ver >> 8) if ver != -1 else (-1, -1),
+            self.get(LCD_GET_CTRL),
+            *self.transport.location(),
+            serial=serial() if serial is not None else None)
+        self.ctrl0, self.ctrl1 = {0: (False, False),
+                                  1: (True, False),
+                                  2: (True, True),
+                                  3: (True, True),
+                                  }.get(self.device_info.controllers,
+                                        (False, False))
+        return self.device_info
 
     def info(self, verbose=True):
         '''print usb device info'''
 
-        device = self.device.getDevice()
-        bus = device.getBusNumber()
-        dev = device.getDeviceAddress()
+        bus, dev = self.device_info.bus, self.device_info.address
         if verbose:
             print('Found LCD2USB device on bus %03d device %03d.' % (bus, dev))
 
@@ -115,9 +1241,10 @@ class LCD(object):
         the usb interfacing'''
 
         try:
-            buf = self.device.controlRead(REQUEST_GET_TYPE, LCD_ECHO, value,
-                                          0, 2, 1000)
-        except usb1.libusb1.USBError:
+            buf = self.transport.read(LCD_ECHO, value)
+        except CircuitOpen:
+            return -1
+        except USBError:
             print('USB request failed!')
             return -1
         ret, = struct.unpack('H', buf)  # unsigned short, size 2
@@ -128,9 +1255,10 @@ class LCD(object):
 
         # send control request and accept return value
         try:
-            buf = self.device.controlRead(REQUEST_GET_TYPE, command, 0, 0, 2,
-                                          1000)
-        except usb1.libusb1.USBError:
+            buf = self.transport.read(command)
+        except CircuitOpen:
+            return -1
+        except USBError:
             print('USB request failed!')
             return -1
 
@@ -141,13 +1269,9 @@ class LCD(object):
 
     @property
     def version(self):
-        '''firmware version of lcd2usb interface'''
-
-        ver = self.get(LCD_GET_FWVER)
+        '''firmware version of lcd2usb interface, see refresh()'''
 
-        if ver != -1:
-            return (ver & 0xff, ver >> 8)
-        return -1, -1
+        return self.device_info.version
 
     def _get_controller(self):
         '''get the bit mask of installed LCD controllers
@@ -156,7 +1280,7 @@ class LCD(object):
         1 = single controller display,
         3 = dual controller display'''
 
-        return self.get(LCD_GET_CTRL)
+        return self.device_info.controllers
 
     @property
     def keys(self):
@@ -166,13 +1290,22 @@ class LCD(object):
 
         return bool(keymask & 1), bool(keymask & 2)
 
+    @_locked
     def set(self, command, value):
-        '''set a value in the LCD interface'''
+        '''set a value in the LCD interface
 
+        Values already set are not sent again.'''
+
+        if self.settings.get(command) == value:
+            return 0
+        self.settings[command] = value
         try:
-            self.device.controlWrite(TYPE_VENDOR, command, value, 0, '', 1000)
-        except usb1.libusb1.USBError:
+            self.transport.write(command, value)
+        except CircuitOpen:
+            pass  # applied by resync()
+        except USBError:
             print('USB request failed!')
+            del self.settings[command]  # unknown, send it next time
         return 0
 
     def set_contrast(self, value):
@@ -187,12 +1320,19 @@ class LCD(object):
 
         return self.set(LCD_SET_BRIGHTNESS, value)
 
+    @_locked
     def clear(self):
         '''clear display'''
 
+        if self.frame is not None:
+            self.frame[:] = b' ' * len(self.frame)
+            self.staged_cursor = 0, self.geometry.row_addresses[0]
+            return
+
         self.command(0x01)  # clear display
         self.home()
 
+    @_locked
     def command(self, command, ctrl=LCD_BOTH):
         '''see HD44780 datasheet for a command description'''
 
@@ -205,6 +1345,63 @@ class LCD(object):
         # LL = number of bytes in transfer - 1
 
         self._enqueue(LCD_CMD | ctrl, command)
+        self._track_command(command, ctrl)
+
+    def _track_command(self, command, ctrl=LCD_BOTH):
+        '''update the modelled address counters and shadow after a command'''
+
+        targets = self.geometry.targets(ctrl)
+        if command in (0x01, 0x02, 0x03) and \
+                len(targets) == self.geometry.controllers:
+            # writing continues in the first row after clear or home
+            self.ctrl = self.geometry.row_targets[0]
+        if command == 0x01 and len(targets) == self.geometry.controllers:
+            self.shadow[:] = b' ' * len(self.shadow)
+            self.shadow_valid = True
+        elif command == 0x01:
+            # only some rows cleared
+            self.shadow_valid = False
+
+        for controller in targets:
+            if command & 0x80:  # set DDRAM address
+                self.addresses[controller] = command & 0x7f
+                self.cgram_modes[controller] = False
+            elif command & 0x40:  # set CGRAM address
+                self.addresses[controller] = None
+                self.cgram_modes[controller] = True
+            elif command in (0x01, 0x02, 0x03):  # clear display, home
+                self.addresses[controller] = 0
+                self.cgram_modes[controller] = False
+                self.shifts[controller] = 0
+            elif command & 0xf8 == 0x18:  # display shift, address stays
+                shift = self.shifts[controller] + (-1 if command & 0x04 else 1)
+                self.shifts[controller] = shift % LINE_LENGTH
+            elif command & 0xf0 == 0x10 or command & 0xfc == 0x04:
+                # cursor shift or entry mode set, the address is not modelled
+                self.addresses[controller] = None
+
+    def _track_data(self, data, ctrl=LCD_BOTH):
+        '''update the modelled address counters and shadow after data'''
+
+        for controller in self.geometry.targets(ctrl):
+            if self.cgram_modes[controller]:
+                continue
+            address = self.addresses[controller]
+            if address is None:
+                # written somewhere unknown
+                self.shadow_valid = False
+                continue
+            # copy whole row segments instead of single cells
+            position = 0
+            while position < len(data):
+                cell, length = self.geometry.segment(controller, address)
+                length = min(length, len(data) - position)
+                if cell is not None:
+                    self.shadow[cell:cell + length] = \
+                        data[position:position + length]
+                position += length
+                address = DDRAM_WRAP.get(address + length, address + length)
+            self.addresses[controller] = address
 
     def _enqueue(self, command_type, value):
         '''enqueue a command into the buffer'''
@@ -222,6 +1419,36 @@ class LCD(object):
         if self.buffer_current_fill == self.BUFFER_MAX_CMD:
             self._flush()
 
+    def _enqueue_bytes(self, command_type, data):
+        '''enqueue a run of bytes of the same type
+
+        Complete groups of four bytes are sent straight away, with value and
+        index of all of them unpacked in one go, only the bytes before and
+        after them pass through the buffer.'''
+
+        data = memoryview(data)
+        position = 0
+        if self.buffer_current_type == command_type:
+            # top up the buffer, which flushes it once it is full
+            position = min(len(data),
+                           self.BUFFER_MAX_CMD - self.buffer_current_fill)
+            for value in data[:position]:
+                self._enqueue(command_type, value)
+        elif self.buffer_current_type >= 0:
+            self._flush()
+
+        groups = (len(data) - position) // self.BUFFER_MAX_CMD
+        if groups:
+            end = position + groups * self.BUFFER_MAX_CMD
+            request = command_type | (self.BUFFER_MAX_CMD - 1)
+            for value, index in struct.iter_unpack('<HH',
+                                                   data[position:end]):
+                self._send(request, value, index)
+            position = end
+
+        for value in data[position:]:
+            self._enqueue(command_type, value)
+
     def _flush(self):
         '''flush command queue due to buffer overflow / content
         change or due to explicit request'''
@@ -248,52 +1475,209 @@ class LCD(object):
     def _send(self, request, value, index):
         '''send an usb control message'''
         try:
-            self.device.controlWrite(TYPE_VENDOR, request, value,
-                                     index, b'', 1000)
-        except usb1.libusb1.USBError:
+            self.transport.write(request, value, index)
+        except CircuitOpen:
+            return -1  # the shadow keeps track, see resync()
+        except USBError:
             print('USB request failed!')
             return -1
         return 0
 
+    @_locked
     def home(self):
         '''home display'''
 
         self.command(0x03)  # return home
 
-    def write(self, data, column=None, row=None, ctrl=LCD_BOTH):
-        '''write a data string to the display'''
+    @_locked
+    def write(self, data, column=None, row=None, ctrl=None):
+        '''write a data string to the display
 
-        if isinstance(row, int) and isinstance(column, int):
-            self.goto(column, row)
+        Goes to the controller showing the cursor's row unless ctrl says
+        otherwise. While a frame is staged, the data goes to the frame.'''
 
+        # before moving the cursor, encoding may define custom characters
+        positioned = isinstance(row, int) and isinstance(column, int)
         if isinstance(data, str):
-            data = bytearray(data, 'ascii')
-        for char in data:
-            self._enqueue(LCD_DATA | ctrl, char)
+            cursor = list(zip(self.addresses, self.cgram_modes))
+            data = self.encode(data)
+            if not positioned and self.frame is None:
+                self._restore_cursor(cursor, ctrl)
+        if self.frame is not None:
+            self._stage(data, column, row, ctrl)
+            return
+        if positioned:
+            self._goto(column, row)
 
+        self._write(data, ctrl)
         self._flush()
-
-    def write_char(self, char, column=None, row=None, ctrl=LCD_BOTH):
+        self._check_resync()
+
+    def _restore_cursor(self, cursor, ctrl=None):
+        '''move the controllers data goes to back to their DDRAM addresses
+        in cursor, a list of (address, cgram_mode), if uploading custom
+        characters switched them to CGRAM'''
+
+        geometry = self.geometry
+        for controller in geometry.targets(self.ctrl if ctrl is None
+                                           else ctrl):
+            address, cgram_mode = cursor[controller]
+            if cgram_mode or not self.cgram_modes[controller]:
+                continue
+            if address is None:
+                raise ValueError('cursor position lost uploading custom '
+                                 'characters, pass column and row')
+            target = LCD_BOTH if geometry.controllers == 1 else \
+                (LCD_CTRL_0, LCD_CTRL_1)[controller]
+            self.command(0x80 | address, target)
+
+    def _write(self, data, ctrl=None):
+        '''enqueue a data string without flushing the buffer, so that
+        consecutive writes can share DATA transfers'''
+
+        if ctrl is None:
+            ctrl = self.ctrl
+        if isinstance(data, str):
+            data = self.charset.encode(data)
+        elif not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)  # any iterable of codes, e.g. a list
+        self._enqueue_bytes(LCD_DATA | ctrl, data)
+        self._track_data(data, ctrl)
+
+    def _stage(self, data, column, row, ctrl):
+        '''write data into the staged frame, continuing in the next cells
+        as the HD44780 would'''
+
+        geometry = self.geometry
+        if ctrl is not None:
+            raise ValueError('writes to a given controller cannot be staged')
+        if isinstance(row, int) and isinstance(column, int):
+            if not 0 <= row < geometry.rows:
+                row = 0
+            self.staged_cursor = (geometry.controller(row),
+                                  geometry.row_addresses[row] + column)
+        elif self.staged_cursor is None:
+            raise ValueError('cursor position unknown in the staged frame, '
+                             'pass column and row')
+        controller, address = self.staged_cursor
+        for value in bytes(data):
+            cell = geometry.cell(controller, address)
+            if cell is not None:
+                self.frame[cell] = value
+            address = _next_address(address)
+        self.staged_cursor = controller, address
+
+    def write_char(self, char, column=None, row=None, ctrl=None):
         '''write a char to the display'''
 
         self.write(bytearray([char]), column=column, row=row, ctrl=ctrl)
 
+    @_locked
     def goto(self, column, row):
         '''set cursor on column(x) and row(y)'''
 
-        address = {0: 0x80, 1: 0xc0, 2: 0x94, 3: 0xd4}
+        if not 0 <= row < self.geometry.rows:
+            row = 0
+        if self.frame is not None:
+            self.staged_cursor = (self.geometry.controller(row),
+                                  self.geometry.row_addresses[row] + column)
+            return
+        self._goto(column, row)
+
+    def _goto(self, column, row):
+        '''move the cursor of the display, also while a frame is staged'''
+
+        if not 0 <= row < self.geometry.rows:
+            row = 0
+        self._unshift()
+        address = self.geometry.row_addresses[row] + column
+        self.ctrl = self.geometry.row_targets[row]
+
+        # the cursor is already there, e.g. after writing the previous cell
+        controller = self.geometry.controller(row)
+        if address == self.addresses[controller] and \
+                not self.cgram_modes[controller]:
+            return
+
+        self.command(0x80 | address, self.ctrl)
+
+    def _unshift(self):
+        '''undo display shifts, so that cells show their DDRAM addresses
+        again as the shadow and goto() assume'''
+
+        if any(self.shifts):
+            self.home()
 
-        self.command(address.get(row, 0x80) + column)
+    @_locked
+    def shift_display(self, steps=1):
+        '''shift the contents of all rows `steps` cells to the left, or to
+        the right if negative
 
+        Each row rotates through its 40 cell DDRAM line, one command per
+        step. The next cursor move shifts the display back.'''
+
+        command = 0x18 if steps > 0 else 0x1c
+        for _ in range(abs(steps)):
+            self.command(command)
+        self._flush()
+
+    @_locked
     def define_char(self, ascii_, data):
         '''recording custom symbol to the HD44780 memory'''
 
         # try http://www.quinapalus.com/hd44780udg.html to design your chars
 
+        pattern = bytes(data)
+        if self.glyphs.patterns[ascii_] == pattern:
+            return  # already there
+
+        # define it in all controllers
         base_address = 0x40 | (ascii_ << 3)
         self.command(base_address)
-        self.write(data)
+        self._write(pattern, LCD_BOTH)  # to CGRAM, also while staging
+        self._flush()
+        self.glyphs.assign(ascii_, pattern)
+
+    @_locked
+    def encode(self, text):
+        '''codes showing text on the display, see Charset
 
+        Characters missing from the character ROM are shown as custom
+        characters if the charset has a fallback pattern for them, which are
+        uploaded to CGRAM as needed.'''
+
+        charset = self.charset
+        try:
+            return codecs.charmap_encode(text, 'strict',
+                                         charset.encoding_table)[0]
+        except UnicodeEncodeError:
+            pass
+        text = text.translate(charset.translation)
+        glyphs = {ord(char): self.glyph(pattern)
+                  for char, pattern in charset.fallbacks.items()
+                  if char in text}
+        return charset.encode(text.translate(glyphs))
+
+    @_locked
+    def glyph(self, pattern):
+        '''character code showing a custom character pattern
+
+        The pattern is uploaded to CGRAM only if it is not resident yet,
+        replacing the least recently used one if all 8 slots are taken.
+        Slots shown on the display or in the staged frame are replaced
+        last.'''
+
+        pattern = bytes(pattern)
+        slot = self.glyphs.lookup(pattern)
+        if slot is None:
+            cells = set(self.shadow).union(self.frame or b'')
+            # codes 8-15 show the custom characters 0-7 as well
+            shown = {code & 7 for code in cells if code < 16}
+            slot = self.glyphs.victim(shown)
+            self.define_char(slot, pattern)
+        return slot
+
+    @_locked
     def hello(self):
         '''display a hello screen on your lcd2usb device.
 
@@ -309,23 +1693,688 @@ class LCD(object):
         self.write_char(0, 0, 0)
         self.write_char(0, 19, 0)
 
+    @_locked
     def fill(self, message, row_index=0, align='left'):
         '''Fill a row with a message with a given alignment.'''
-        if not isinstance(message, str):
-            message = str(message)
-        size = 20
-        if len(message) > size:
-            fillup = message[:size]
+        columns = self.geometry.columns
+        fillup = _fill_row(message, align, columns)
+        if self.frame is not None:
+            start = row_index * columns
+            self.frame[start:start + columns] = self.encode(fillup)
+            return
+        self.write(fillup, 0, row_index)
+
+    def compile(self, frame):
+        '''compile a frame into a Program painting it over any contents
+
+        Each chain of rows (see Geometry.chains) is painted with one cursor
+        move followed by full DATA transfers to its controller.'''
+
+        geometry = self.geometry
+        frame = bytes(frame)
+        transfers = []
+        addresses = [None] * geometry.controllers
+        for chain in geometry.chains():
+            target = geometry.row_targets[chain[0]]
+            address = geometry.row_addresses[chain[0]]
+            transfers.append((LCD_CMD | target, 0x80 | address, 0))
+            data = b''.join(geometry.row(frame, row) for row in chain)
+            for start in range(0, len(data), 4):
+                group = data[start:start + 4]
+                value, index = struct.unpack('<HH', group.ljust(4, b'\0'))
+                transfers.append(
+                    (LCD_DATA | target | (len(group) - 1), value, index))
+            addresses[geometry.controller(chain[0])] = \
+                _advance(address, len(data))
+        return Program(tuple(transfers), frame, tuple(addresses))
+
+    @_locked
+    def run(self, program):
+        '''send a compiled Program and update the shadow accordingly'''
+
+        self._check_resync()
+        self._unshift()
+        self._flush()
+        for request, value, index in program.transfers:
+            self._send(request, value, index)
+        self.shadow[:] = program.frame
+        self.shadow_valid = True
+        self.addresses[:] = program.address
+        self.cgram_modes[:] = [False] * len(self.cgram_modes)
+        self._check_resync()
+
+    @_locked
+    def show(self, frame):
+        '''paint a whole frame using a cached compiled Program
+
+        Meant for frames shown again and again, such as waiting screens,
+        which then go straight to the transport.'''
+
+        frame = bytes(frame)
+        program = self.programs.get(frame)
+        if program is None:
+            program = self.programs[frame] = self.compile(frame)
+            if len(self.programs) > PROGRAM_CACHE_SIZE:
+                self.programs.popitem(last=False)
+        else:
+            self.programs.move_to_end(frame)
+        self.run(program)
+
+    @contextlib.contextmanager
+    def atomic(self):
+        '''stage the updates of a with block as one frame, committed when
+        the block ends
+
+        No other thread can change the display in between, and the frame
+        is discarded if the block raises. Inside another frame, the updates
+        become part of that frame.'''
+
+        with self.lock:
+            outer = self.frame
+            saved = None if outer is None else bytes(outer)
+            cursor = self.staged_cursor
+            self.begin_frame()
+            try:
+                yield self
+            except BaseException:
+                if outer is None:
+                    self.frame = None
+                else:
+                    self.frame[:] = saved
+                    self.staged_cursor = cursor
+                raise
+            if outer is None:
+                self.commit()
+
+    @_locked
+    def begin_frame(self):
+        '''start staging a frame
+
+        Until commit() is called, fill(), clear() and write() only change
+        the staged frame instead of the display.'''
+
+        if self.frame is None:
+            self.frame = bytearray(self.shadow)
+            # writes continue at the cursor, if it shows a known cell
+            controller = self.geometry.targets(self.ctrl)[0]
+            address = self.addresses[controller]
+            self.staged_cursor = None
+            if address is not None and not self.cgram_modes[controller] \
+                    and not self.shifts[controller]:
+                self.staged_cursor = controller, address
+
+    @_locked
+    def commit(self):
+        '''send the staged frame to the display
+
+        The frame is compared against the shadow of the display contents and
+        only the runs of changed cells are sent, each preceded by one cursor
+        move. Returns the number of cells sent.'''
+
+        frame, self.frame = self.frame, None
+        if frame is None:
+            return 0
+        return self.draw(frame)
+
+    @_locked
+    def reconnect(self, device=None):
+        '''open the USB device again, the given usb1.USBDevice or the first
+        one found, and restore the display contents and custom characters
+        from the shadow, see HotplugWatcher'''
+
+        base_transport(self.transport).reopen(device)
+        reset = getattr(self.transport, 'reset', None)
+        if reset is not None:
+            reset()
+        # the device restarted and initialised the display
+        self.addresses[:] = [None] * len(self.addresses)
+        self.cgram_modes[:] = [False] * len(self.cgram_modes)
+        self.shifts[:] = [0] * len(self.shifts)
+        self.refresh()
+        self.resync()
+
+    def _check_resync(self):
+        if not self._resyncing and \
+                getattr(self.transport, 'needs_resync', False):
+            self.resync()
+
+    @_locked
+    def resync(self):
+        '''repaint the display from the shadow and set the custom characters,
+        brightness and contrast again, after transfers may have been lost
+
+        Called before and after draw() and run(), and after write(), when
+        the transport asks for it, see ResilientTransport. Repeated while
+        the transport asks again during the repaint, up to RESYNC_LIMIT
+        times.'''
+
+        self._resyncing = True
+        try:
+            for _ in range(RESYNC_LIMIT):
+                if hasattr(self.transport, 'needs_resync'):
+                    self.transport.needs_resync = False
+                self._repaint()
+                if not getattr(self.transport, 'needs_resync', False):
+                    break
+        finally:
+            self._resyncing = False
+
+    def _repaint(self):
+        settings, self.settings = self.settings, {}
+        for command, value in settings.items():
+            self.set(command, value)
+        patterns = self.glyphs.patterns
+        self.glyphs.clear()
+        for slot, pattern in enumerate(patterns):
+            if pattern is not None:
+                self.define_char(slot, pattern)
+        self.run(self.compile(self.shadow))
+
+    @_locked
+    def draw(self, frame):
+        '''bring the display to the contents of frame (one byte per cell,
+        row by row) by sending only the cells that differ from the shadow'''
+
+        self._check_resync()
+        if not self.shadow_valid:
+            # contents unknown, start over from a blank display; not with
+            # clear(), which would only blank a frame staged meanwhile
+            self.command(0x01)
+            self.home()
+
+        # walk each controller's rows in DDRAM address order so that runs
+        # continuing into the next row need no cursor move and share DATA
+        # transfers
+        geometry = self.geometry
+        columns = geometry.columns
+        sent = 0
+        for chain in geometry.chains():
+            old = bytearray().join(geometry.row(self.shadow, row)
+                                   for row in chain)
+            new = bytearray().join(geometry.row(frame, row) for row in chain)
+            if old == new:
+                continue
+            for first, last in _changed_runs(old, new):
+                self._goto(first % columns, chain[first // columns])
+                self._write(new[first:last])
+                sent += last - first
+        self._flush()
+        self._check_resync()
+        return sent
+
+    def fill_center(self, message, row_index=0):
+        '''Fill a row with a message, center-aligned.'''
+        self.fill(message, row_index, align='center')
+
+    def fill_right(self, message, row_index=0):
+        '''Fill a row with a message, right-aligned.'''
+        self.fill(message, row_index, align='right')
+
+
+class Marquee(object):
+    '''rows of text scrolling to the left, one cell per step()
+
+    texts maps row numbers to texts, each scrolls around with separator
+    between its end and its start. If every row of the display scrolls, and
+    the rows start the DDRAM lines and fit into them (16x2, 20x2, 40x2 and
+    40x4 displays), the whole display is shifted by the controllers with a
+    single command per step. Otherwise the rows are redrawn, which only sends
+    the cells that changed.'''
+
+    def __init__(self, lcd, texts, separator='   '):
+        self.lcd = lcd
+        geometry = lcd.geometry
+        self.loops = {row: text + separator for row, text in texts.items()}
+        self.hardware = \
+            sorted(self.loops) == list(range(geometry.rows)) and \
+            all(address in (0x00, 0x40)
+                for address in geometry.row_addresses) and \
+            all(len(loop) <= LINE_LENGTH for loop in self.loops.values())
+        size = LINE_LENGTH if self.hardware else geometry.columns
+        self.loops = {row: lcd.encode(loop.ljust(size))
+                      for row, loop in self.loops.items()}
+        self.position = 0  # steps so far
+        self.loaded = False
+
+    def _visible(self, row):
+        '''the part of a row's loop shown at the current position'''
+
+        loop = self.loops[row]
+        start = self.position % len(loop)
+        return (loop + loop)[start:start + self.lcd.geometry.columns]
+
+    def _in_place(self):
+        '''whether the display still shows the marquee, nothing else was
+        drawn over it'''
+
+        lcd = self.lcd
+        shift = self.position % LINE_LENGTH
+        return self.loaded and lcd.shadow_valid and \
+            lcd.shifts == [shift] * len(lcd.shifts) and \
+            all(lcd.geometry.row(lcd.shadow, row) ==
+                loop[:lcd.geometry.columns]
+                for row, loop in self.loops.items())
+
+    def _load(self):
+        '''write the whole loops to DDRAM and shift them into position'''
+
+        lcd = self.lcd
+        for row, loop in sorted(self.loops.items()):
+            lcd._goto(0, row)  # the display's cursor, also while staging
+            lcd._write(loop)
+        # shift the shorter way round
+        shift = self.position % LINE_LENGTH
+        lcd.shift_display(shift if shift <= LINE_LENGTH // 2
+                          else shift - LINE_LENGTH)
+        self.loaded = True
+
+    def step(self):
+        '''scroll every row by one cell'''
+
+        with self.lcd.lock:
+            self._step()
+
+    def _step(self):
+        if self.hardware:
+            in_place = self._in_place()
+            self.position += 1
+            if in_place:
+                self.lcd.shift_display(1)
+            else:
+                self._load()
+            if self.lcd.frame is not None:
+                # every row scrolls, keep commit() from drawing over them
+                self.lcd.frame[:] = self.lcd.shadow
+            return
+
+        self.position += 1
+        staged = self.lcd.frame is not None
+        self.lcd.begin_frame()
+        columns = self.lcd.geometry.columns
+        for row in self.loops:
+            start = row * columns
+            self.lcd.frame[start:start + columns] = self._visible(row)
+        if not staged:
+            self.lcd.commit()
+
+
+class KeyDebouncer(object):
+    '''turns sampled button states into KeyEvents
+
+    A key changes state after `samples` consecutive samples disagree with
+    its current state, so contact bounce between two samples is ignored. A
+    key held for `long_press` seconds also gives a KEY_LONG_PRESS event
+    before its release.'''
+
+    def __init__(self, keys=2, samples=2, long_press=1.0):
+        self.samples = samples
+        self.long_press = long_press
+        self.down = [False] * keys  # debounced state
+        self.changes = [0] * keys  # consecutive samples disagreeing
+        self.pressed = [0.0] * keys  # when the keys went down
+        self.held = [False] * keys  # long press reported
+
+    def feed(self, keymask, now):
+        '''take a sample of the key bitmask at time now, returns the
+        resulting events'''
+
+        events = []
+        for key, down in enumerate(self.down):
+            if bool(keymask & (1 << key)) == down:
+                self.changes[key] = 0
+                if down and not self.held[key] and \
+                        now - self.pressed[key] >= self.long_press:
+                    self.held[key] = True
+                    events.append(KeyEvent(key, KEY_LONG_PRESS, now,
+                                           now - self.pressed[key]))
+                continue
+            self.changes[key] += 1
+            if self.changes[key] < self.samples:
+                continue
+            self.changes[key] = 0
+            self.down[key] = not down
+            if down:
+                events.append(KeyEvent(key, KEY_RELEASE, now,
+                                       now - self.pressed[key]))
+            else:
+                self.pressed[key] = now
+                self.held[key] = False
+                events.append(KeyEvent(key, KEY_PRESS, now, 0.0))
+        return events
+
+
+class KeyPoller(object):
+    '''reads the two buttons every `interval` seconds from a thread and
+    calls the subscribed callbacks with debounced KeyEvents
+
+    Only reads LCD_GET_KEYS with control reads of its own, which do not
+    touch the write buffer of the LCD, so it can run next to a writer, e.g.
+    a DisplayWriter. Callbacks are called from the polling thread.'''
+
+    def __init__(self, lcd, interval=0.02, samples=2, long_press=1.0):
+        self.lcd = lcd
+        self.interval = interval
+        self.debouncer = KeyDebouncer(samples=samples, long_press=long_press)
+        self.callbacks = []
+        self.failures = 0  # polls that failed
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='lcd2usb-keys')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        deadline = time.monotonic()
+        while not self.stopped.wait(max(0, deadline - time.monotonic())):
+            # keep the cadence, skipping polls missed while busy
+            deadline = max(deadline + self.interval, time.monotonic())
+            keymask = self.lcd.get(LCD_GET_KEYS)
+            if keymask < 0:
+                self.failures += 1
+                continue
+            for event in self.debouncer.feed(keymask, time.monotonic()):
+                for callback in list(self.callbacks):
+                    callback(event)
+
+    def subscribe(self, callback):
+        '''call callback(event) for every KeyEvent, returns callback so this
+        can be used as a decorator'''
+
+        self.callbacks.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        '''stop calling callback'''
+
+        self.callbacks.remove(callback)
+
+    def close(self):
+        '''stop polling'''
+
+        self.stopped.set()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+
+class Fader(object):
+    '''fades the brightness (or contrast) of an LCD on a scheduler
+
+    The scheduler is anything with every(interval, callback) and
+    cancel(job) methods and a clock, like scheduler.Scheduler. Steps run at
+    most `rate` times per second and only values that changed are sent (see
+    LCD.set()), so a slow fade sends one transfer per brightness step.'''
+
+    def __init__(self, lcd, scheduler, command=LCD_SET_BRIGHTNESS,
+                 rate=FADE_RATE):
+        self.lcd = lcd
+        self.scheduler = scheduler
+        self.command = command
+        self.rate = rate
+        self.job = None
+        # start and target value, start time and duration of the fade, set
+        # as one so the scheduler thread never sees half of a new fade
+        self.plan = (0, 0, 0.0, 1.0)
+        self.lock = threading.Lock()  # of job and plan
+
+    def fade(self, target, duration=1.0):
+        '''move from the current value to target (0-255) over duration
+        seconds, replacing any fade in progress'''
+
+        current = self.lcd.settings.get(self.command)
+        if current is None or duration <= 0:
+            # nothing to start from
+            self.stop()
+            self.lcd.set(self.command, target)
+            return
+        with self.lock:
+            self.plan = (current, target, self.scheduler.clock(), duration)
+            if self.job is None:
+                self.job = self.scheduler.every(1.0 / self.rate, self._step,
+                                                name='fade')
+
+    def _step(self):
+        plan = self.plan
+        start, target, started, duration = plan
+        done = min((self.scheduler.clock() - started) / duration, 1.0)
+        # not holding the lock, set() waits for the LCD's lock
+        self.lcd.set(self.command, round(start + (target - start) * done))
+        if done >= 1.0:
+            with self.lock:
+                if self.plan is plan:  # no new fade started meanwhile
+                    self._stop()
+
+    @property
+    def fading(self):
+        '''whether a fade is in progress'''
+
+        return self.job is not None
+
+    def stop(self):
+        '''stop fading at the current value'''
+
+        with self.lock:
+            self._stop()
+
+    def _stop(self):
+        if self.job is not None:
+            self.scheduler.cancel(self.job)
+            self.job = None
+
+
+class HotplugWatcher(object):
+    '''reconnects an LCD whose device was unplugged once it is back
+
+    Uses libusb hotplug events where supported. Elsewhere it polls every
+    `interval` seconds, and only enumerates the bus while the transport's
+    circuit is open (see ResilientTransport), so the bus is not scanned
+    while the display works. A device with another serial number than the
+    lost one is ignored.'''
+
+    def __init__(self, lcd, interval=1.0):
+        self.lcd = lcd
+        self.interval = interval
+        self.context = base_transport(lcd.transport).context
+        self.location = lcd.device_info.bus, lcd.device_info.address
+        self.serial = lcd.device_info.serial
+        self.lost = False
+        # usb1.USBDevices plugged in, appended by whichever thread handles
+        # the libusb events
+        self.arrived = collections.deque()
+        self.reconnects = 0
+
+        self.hotplug = None
+        if self.context.hasCapability(usb1.CAP_HAS_HOTPLUG):
+            self.hotplug = self.context.hotplugRegisterCallback(
+                self._hotplug, flags=0, vendor_id=LCD2USB_VENDOR_ID,
+                product_id=LCD2USB_PRODUCT_ID)
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run,
+                                       name='lcd2usb-hotplug')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _hotplug(self, context, device, event):
+        '''hotplug callback, only takes note: libusb must not be called
+        from here'''
+
+        if event == usb1.HOTPLUG_EVENT_DEVICE_LEFT:
+            if (device.getBusNumber(), device.getDeviceAddress()) == \
+                    self.location:
+                self.lost = True
         else:
-            if align == 'left':
-                fillup = message.ljust(size)
-            elif align == 'center':
-                fillup = message.center(size)
-            elif align == 'right':
-                fillup = message.rjust(size)
+            self.arrived.append(device)
+        return False  # stay registered
+
+    def _link_down(self):
+        return self.lost or getattr(self.lcd.transport, 'open', False)
+
+    def _run(self):
+        candidates = []
+        while not self.stopped.is_set():
+            if self.hotplug is not None:
+                self.context.handleEventsTimeout(self.interval)
+                while self.arrived:
+                    candidates.append(self.arrived.popleft())
+                if not self.lost:
+                    candidates = []
+                    continue
             else:
-                fillup = message.ljust(size)
-        self.write(fillup, 0, row_index)
+                if self.stopped.wait(self.interval) or \
+                        not self._link_down():
+                    continue
+                candidates = find_all(self.context)
+            # devices failing to open are tried again next time
+            for device in candidates:
+                if self._reconnect(device):
+                    candidates = []
+                    break
+
+    def _reconnect(self, device):
+        try:
+            if self.serial is not None and \
+                    device.getSerialNumber() != self.serial:
+                return False
+            self.lcd.reconnect(device)
+        except (USBError, LCD2USBNotFound):
+            return False
+        self.location = self.lcd.device_info.bus, \
+            self.lcd.device_info.address
+        self.lost = False
+        self.reconnects += 1
+        return True
+
+    def close(self):
+        '''stop watching'''
+
+        self.stopped.set()
+        self.thread.join()
+        if self.hotplug is not None:
+            self.context.hotplugDeregisterCallback(self.hotplug)
+            self.hotplug = None
+
+
+class DisplayWriter(object):
+    '''LCD wrapper that sends whole frames from a dedicated writer thread
+
+    Frames are handed over through a single slot: a frame that has not been
+    sent yet is replaced by a newer one, so the producer never waits for USB
+    and stale frames are never transmitted. Supports the frame and fill API
+    of LCD, so it can be passed to screens instead of an LCD.'''
+
+    def __init__(self, lcd):
+        self.lcd = lcd
+        self.frame = bytearray(lcd.shadow)  # frame being built
+        self.staging = False
+        self.pending = None  # next frame to send, see submit()
+        self.cached = False  # send it with LCD.show() instead of draw()
+        self.busy = False
+        self.dropped = 0  # frames replaced before being sent
+        self.condition = threading.Condition()
+        self.lock = threading.RLock()  # of the frame being built
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run,
+                                       name='lcd2usb-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                frame, self.pending = self.pending, None
+                cached = self.cached
+                self.busy = True
+            try:
+                if cached:
+                    self.lcd.show(frame)
+                else:
+                    self.lcd.draw(frame)
+            except Exception:
+                # keep serving, the next frame is drawn from scratch
+                logger.exception('Drawing a frame failed')
+                with self.lcd.lock:
+                    self.lcd.shadow_valid = False
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+    def submit(self, frame, cached=False):
+        '''queue a whole frame (one byte per cell), replacing any frame
+        that has not been sent yet
+
+        With cached set, the frame is painted with LCD.show(), from a
+        compiled Program, instead of sending the cells that changed.'''
+
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = bytes(frame)
+            self.cached = cached
+            self.condition.notify_all()
+
+    @_locked
+    def show(self, frame):
+        '''queue a whole frame, e.g. one made with frame_of(), to be painted
+        from its cached compiled Program, see LCD.show()'''
+
+        self.frame[:] = frame
+        self.submit(frame, cached=True)
+
+    @contextlib.contextmanager
+    def atomic(self):
+        '''stage the updates of a with block as one frame, queued when the
+        block ends, see LCD.atomic()'''
+
+        with self.lock:
+            staging, saved = self.staging, bytes(self.frame)
+            self.begin_frame()
+            try:
+                yield self
+            except BaseException:
+                self.frame[:] = saved
+                self.staging = staging
+                raise
+            if not staging:
+                self.commit()
+
+    @_locked
+    def begin_frame(self):
+        '''start staging a frame, see LCD.begin_frame()'''
+
+        self.staging = True
+
+    @_locked
+    def commit(self):
+        '''queue the staged frame for sending'''
+
+        self.staging = False
+        self.submit(self.frame)
+
+    @_locked
+    def clear(self):
+        '''clear display'''
+
+        self.frame[:] = b' ' * len(self.frame)
+        if not self.staging:
+            self.commit()
+
+    @_locked
+    def fill(self, message, row_index=0, align='left'):
+        '''Fill a row with a message with a given alignment.'''
+        columns = self.lcd.geometry.columns
+        start = row_index * columns
+        # ROM characters only, custom characters would have to be uploaded
+        # from this thread
+        self.frame[start:start + columns] = \
+            self.lcd.charset.encode(_fill_row(message, align, columns))
+        if not self.staging:
+            self.commit()
 
     def fill_center(self, message, row_index=0):
         '''Fill a row with a message, center-aligned.'''
@@ -335,6 +2384,88 @@ class LCD(object):
         '''Fill a row with a message, right-aligned.'''
         self.fill(message, row_index, align='right')
 
+    @property
+    def stats(self):
+        '''transfer statistics of the LCD, see TransferStats'''
+
+        return self.lcd.stats
+
+    def flush(self):
+        '''wait until the last queued frame has been sent'''
+
+        with self.condition:
+            while (self.pending is not None or self.busy) and \
+                    self.thread.is_alive():
+                self.condition.wait(0.1)
+        self.lcd.sync()
+
+    def close(self):
+        '''send the last queued frame, stop the writer and close the LCD'''
+
+        self.flush()
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+        self.lcd.close()
+
+
+class DisplayManager(object):
+    '''all attached LCD2USB devices, each driven by its own DisplayWriter
+
+    Displays are addressed by their bus and port path (see device_path) or
+    serial number, and refresh in parallel since every DisplayWriter has
+    its own thread:
+
+        displays = DisplayManager()
+        for path, display in displays.items():
+            display.fill_center(path)
+    '''
+
+    def __init__(self, async_depth=0, context=None):
+        if context is None:
+            context = shared_context()
+        self.context = context
+        self.writers = collections.OrderedDict()  # path -> DisplayWriter
+        self.serials = {}  # serial number -> path
+
+        for device in find_all(context):
+            path = device_path(device)
+            # the failure policy of LCD() for each display
+            transport = ResilientTransport(USBTransport(
+                async_depth, TRANSFER_TIMEOUT, context=context,
+                device=device))
+            lcd = LCD(transport=transport)
+            self.writers[path] = DisplayWriter(lcd)
+            serial = lcd.device_info.serial
+            if serial:
+                self.serials[serial] = path
+
+        if not self.writers:
+            raise LCD2USBNotFound()
+
+    def __getitem__(self, key):
+        '''display by path or serial number'''
+
+        return self.writers[self.serials.get(key, key)]
+
+    def __iter__(self):
+        return iter(self.writers)
+
+    def __len__(self):
+        return len(self.writers)
+
+    def items(self):
+        '''(path, DisplayWriter) pairs'''
+
+        return self.writers.items()
+
+    def close(self):
+        '''send the last frames and close all displays'''
+
+        for writer in self.writers.values():
+            writer.close()
+
 
 def test():
     '''Test the lcd2usb device and show a demo.
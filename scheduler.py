@@ -0,0 +1,169 @@
+"""Drift-free scheduler for periodic jobs.
+
+Jobs run on a fixed grid of monotonic deadlines (multiples of their interval
+plus an offset), so the time a job takes does not add to its period. A job
+that misses deadlines skips them instead of catching up in a burst, and the
+overrun is reported.
+
+    timer = Scheduler()
+    timer.every(0.5, render)
+    timer.every(60, log_stats)
+    timer.run()
+"""
+
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+
+
+logger = logging.getLogger("scheduler")
+
+
+class Job:
+    """A periodic job of a Scheduler.
+
+    Attributes
+    ----------
+        deadline: (float) when the job runs next, on the scheduler's clock.
+        runs: (int) number of times the job ran.
+        overruns: (int) number of times the job ran late and skipped ticks.
+        skipped: (int) total number of ticks skipped.
+
+    """
+
+    __slots__ = ('name', 'interval', 'offset', 'callback', 'deadline',
+                 'runs', 'overruns', 'skipped', 'cancelled')
+
+    def __init__(self, name, interval, offset, callback, deadline):
+        self.name = name
+        self.interval = interval
+        self.offset = offset
+        self.callback = callback
+        self.deadline = deadline
+        self.runs = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.cancelled = False
+
+    def __repr__(self):
+        return "<Job {!r} every {} s>".format(self.name, self.interval)
+
+
+def _log_overrun(job: Job, late: float, skipped: int):
+    logger.warning("%s ran %.3f s late, skipped %d tick(s)",
+                   job.name, late, skipped)
+
+
+class Scheduler:
+    """Run several periodic jobs from one timer.
+
+    Arguments
+    ---------
+        on_overrun: called as on_overrun(job, late, skipped) when a job
+            runs a full interval or more behind its deadline. Logs a
+            warning by default.
+        clock: monotonic clock returning seconds.
+
+    """
+
+    def __init__(self, on_overrun=_log_overrun, clock=time.monotonic):
+        self.on_overrun = on_overrun
+        self.clock = clock
+        self._queue = []  # heap of (deadline, order, job)
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = False
+
+    def every(self, interval: float, callback, name=None,
+              offset=0.0) -> Job:
+        """Run callback() every `interval` seconds.
+
+        The first run is at the next grid point, a multiple of `interval`
+        plus `offset`. Jobs due at the same time run in the order they were
+        added.
+
+        Returns
+        -------
+            (Job) the job, e.g. for cancel().
+
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        ticks = math.ceil((self.clock() - offset) / interval)
+        job = Job(name or getattr(callback, '__name__', repr(callback)),
+                  interval, offset, callback, ticks * interval + offset)
+        self._push(job)
+        return job
+
+    def cancel(self, job: Job):
+        """Stop running a job."""
+        job.cancelled = True
+        self._wakeup.set()
+
+    def _push(self, job):
+        with self._lock:
+            heapq.heappush(self._queue, (job.deadline, next(self._order), job))
+        self._wakeup.set()
+
+    def next_deadline(self):
+        """Deadline of the next job to run, or None without jobs."""
+        with self._lock:
+            while self._queue and self._queue[0][2].cancelled:
+                heapq.heappop(self._queue)
+            return self._queue[0][0] if self._queue else None
+
+    def run_pending(self) -> int:
+        """Run the jobs that are due.
+
+        Returns
+        -------
+            (int) the number of jobs run.
+
+        """
+        ran = 0
+        while True:
+            now = self.clock()
+            with self._lock:
+                if not self._queue or self._queue[0][0] > now:
+                    return ran
+                _, _, job = heapq.heappop(self._queue)
+            if job.cancelled:
+                continue
+
+            # skip the ticks that already passed instead of bursting
+            late = now - job.deadline
+            skipped = int(late // job.interval)
+            if skipped:
+                job.overruns += 1
+                job.skipped += skipped
+                if self.on_overrun is not None:
+                    self.on_overrun(job, late, skipped)
+
+            try:
+                job.callback()
+            finally:
+                job.runs += 1
+                job.deadline += (skipped + 1) * job.interval
+                if not job.cancelled:
+                    self._push(job)
+            ran += 1
+
+    def run(self):
+        """Run jobs at their deadlines until stop() is called."""
+        self._running = True
+        while self._running:
+            self.run_pending()
+            self._wakeup.clear()
+            deadline = self.next_deadline()
+            timeout = None if deadline is None else deadline - self.clock()
+            if timeout is None or timeout > 0:
+                self._wakeup.wait(timeout)
+
+    def stop(self):
+        """Make run() return, also from another thread or a job."""
+        self._running = False
+        self._wakeup.set()
@@ -6,12 +6,16 @@ import lcd2usb
 
 
 def basic(lcd: lcd2usb.LCD):
-    """Output basic LCD information and datetime."""
-    bus, dev = lcd.info(False)
-    version = lcd.version
+    """Output basic LCD information and datetime.
+
+    The device facts come from `lcd.device_info`, so only the frame itself
+    is sent.
+    """
+    info = lcd.device_info
     now = datetime.datetime.now()
-    lcd.clear()
-    lcd.fill('LCD Version: {0}.{1}'.format(*version), 0)
-    lcd.fill('Bus: {0:x}, Dev: {1:x}'.format(bus, dev), 1)
-    lcd.fill(str(now), 2)
-    lcd.fill_center('win10py3lcd2usb', 3)
+    with lcd.atomic():
+        lcd.clear()
+        lcd.fill('LCD Version: {0}.{1}'.format(*info.version), 0)
+        lcd.fill('Bus: {0:x}, Dev: {1:x}'.format(info.bus, info.address), 1)
+        lcd.fill(str(now), 2)
+        lcd.fill_center('win10py3lcd2usb', 3)
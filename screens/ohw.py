@@ -1,14 +1,19 @@
 """OpenHardwareMonitor screen."""
 
-import time
 import logging
 
 from wmi_interfaces.OHM import OHM, get_process, wait_for_process
 import lcd2usb
+import scheduler
 
 
 logger = logging.getLogger("ohw")
 
+# seconds between logging the USB transfer statistics
+STATS_INTERVAL = 60
+
+WAITING_FRAME = lcd2usb.frame_of(["Waiting for OHM..."], align='center')
+
 
 def getOrWait(lcd: lcd2usb.LCD, timeout: int) -> int:
     """Check if OpenHardwareMonitor is running and wait if necessary.
@@ -23,8 +28,7 @@ def getOrWait(lcd: lcd2usb.LCD, timeout: int) -> int:
         if not proc:
             logger.warning("OpenHardwareMonitor not running")
 
-            lcd.clear()
-            lcd.fill_center("Waiting for OHM...")
+            lcd.show(WAITING_FRAME)
 
             proc = wait_for_process(timeout)
             if not (proc and proc.ProcessId):
@@ -36,21 +40,33 @@ def getOrWait(lcd: lcd2usb.LCD, timeout: int) -> int:
 
 
 def screen(lcd: lcd2usb.LCD, update_interval=1):
-    """Output information from OpenHardwareMonitor."""
+    """Output information from OpenHardwareMonitor.
+
+    Updates run on a fixed grid of `update_interval` seconds; slow updates
+    skip ticks instead of stretching the period.
+    """
     ohm = None
     ohm_pid = None
 
-    while 1:
+    def update():
+        nonlocal ohm, ohm_pid
         _new_pid = getOrWait(lcd, 60)
         if ohm_pid != _new_pid:
             ohm_pid = _new_pid
             ohm = OHM()
 
-        _cpu(ohm.first_CPU, lcd)
-        _gpu(ohm.first_Gpu, lcd)
-        _ram(ohm.first_RAM, lcd)
+        with lcd.atomic():
+            _cpu(ohm.first_CPU, lcd)
+            _gpu(ohm.first_Gpu, lcd)
+            _ram(ohm.first_RAM, lcd)
+
+    def log_stats():
+        logger.info("USB transfers: %s", lcd.stats.summary())
 
-        time.sleep(update_interval)
+    timer = scheduler.Scheduler()
+    timer.every(update_interval, update, name="ohw")
+    timer.every(STATS_INTERVAL, log_stats, name="stats")
+    timer.run()
 
 
 def _cpu(cpu, lcd: lcd2usb.LCD):
@@ -87,7 +103,7 @@ def _gpu(gpu, lcd: lcd2usb.LCD):
         gpu_temp = gpu.getSensor('Temperature')
         msgs = ('GPU Load: {:.2%}'.format(gpu_load.Value)
                 if gpu_load else 'GPU Load not detected',
-                'GPU Temp: {:.2f} C'.format(gpu_temp.Value)
+                'GPU Temp: {:.2f}{}'.format(gpu_temp.Value, gpu_temp.Units)
                 if gpu_temp else 'GPU Temp not detected')
         lcd.fill(msgs[0], 2)
         lcd.fill(msgs[1], 3)
@@ -25,7 +25,11 @@ if __name__ == '__main__':
 
     # pylint: disable=broad-except
     try:
-        ohw.screen(lcd2usb.LCD(), 0.5)
+        # set LCD2USB_TRACE to record the USB transfers to a file
+        lcd = lcd2usb.LCD(async_depth=8,
+                          trace=os.environ.get('LCD2USB_TRACE'))
+        lcd2usb.HotplugWatcher(lcd)  # reconnect when plugged in again
+        ohw.screen(lcd2usb.DisplayWriter(lcd), 0.5)
     except KeyboardInterrupt:
         logger.info("Exiting due to KeyboardInterrupt")
     except Exception:
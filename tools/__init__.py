@@ -0,0 +1,11 @@
+"""Command line tools for LCD2USB displays, run as `python -m tools.<name>`."""
+
+import os
+import os.path
+import sys
+
+# make lcd2usb and hd44780sim importable as top-level modules, like lib does
+_lib_directory = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib')
+if _lib_directory not in sys.path:
+    sys.path.append(_lib_directory)
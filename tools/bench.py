@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Frame-rate and transfer benchmarks of the LCD driver.
+
+Runs representative workloads against the simulated LCD2USB device and
+prints the results as JSON, so they can be stored and compared over time:
+
+    python -m tools.bench --frames 500 --output bench.json
+
+For every workload it reports the Python CPU time per frame, the control
+transfers per frame, the simulated bus time per frame, and the frames per
+second achievable with both. It also checks that the driver's model of the
+display still agrees with the simulated device afterwards, and exits with
+status 1 if it does not.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import lcd2usb
+import hd44780sim
+
+import characters
+
+
+TICKER = ("win10py3lcd2usb scrolling ticker - CPU, GPU and RAM readings "
+          "from OpenHardwareMonitor - ")
+
+WAITING = lcd2usb.frame_of(['Waiting for OHM...'], align='center')
+
+_BARS = (characters.BAR_0, characters.BAR_1, characters.BAR_2,
+         characters.BAR_3, characters.BAR_4, characters.BAR_5,
+         characters.BAR_6, characters.BAR_7, characters.BAR_8)
+
+
+def redraw(lcd: lcd2usb.LCD, frame: int):
+    """Clear the display and write all four rows."""
+    lcd.clear()
+    lcd.fill('CPU Load: {:.2%}'.format(frame % 100 / 100), 0)
+    lcd.fill('RAM Used: 7.42 GB', 1)
+    lcd.fill('GPU Load: 12.00%', 2)
+    lcd.fill('GPU Temp: 54.00 C', 3)
+
+
+def digit(lcd: lcd2usb.LCD, frame: int):
+    """Commit a dashboard frame in which a single digit changes."""
+    lcd.begin_frame()
+    lcd.fill('CPU Load: 12.3{}%'.format(frame % 10), 0)
+    lcd.fill('RAM Used: 7.42 GB', 1)
+    lcd.fill('GPU Load: 12.00%', 2)
+    lcd.fill('GPU Temp: 54.00 C', 3)
+    lcd.commit()
+
+
+def hello(lcd: lcd2usb.LCD, frame: int):
+    """Show the hello screen."""
+    lcd.hello()
+
+
+def waiting(lcd: lcd2usb.LCD, frame: int):
+    """Show a cached waiting screen with a spinner written behind it."""
+    lcd.show(WAITING)
+    lcd.write('|/-\\'[frame % 4], 16, 1)
+
+
+def cgram(lcd: lcd2usb.LCD, frame: int):
+    """Redefine a custom character."""
+    lcd.define_char(frame % 8, _BARS[frame % len(_BARS)])
+
+
+def ticker(lcd: lcd2usb.LCD, frame: int):
+    """Scroll a text through the last row, one cell per frame."""
+    start = frame % len(TICKER)
+    lcd.begin_frame()
+    lcd.fill((TICKER[start:] + TICKER)[:lcd.geometry.columns], 3)
+    lcd.commit()
+
+
+WORKLOADS = {
+    'redraw': redraw,
+    'digit': digit,
+    'hello': hello,
+    'cgram': cgram,
+    'ticker': ticker,
+    'waiting': waiting,
+}
+
+
+def run(workload, frames: int, warmup: int = 10) -> dict:
+    """Run a workload on a fresh simulated display and measure it."""
+    transport = hd44780sim.SimulatedTransport()
+    lcd = lcd2usb.LCD(transport=transport)
+    lcd.clear()
+    for frame in range(warmup):
+        workload(lcd, frame)
+    lcd.sync()
+
+    transport.reset_counters()
+    started = time.process_time()
+    for frame in range(warmup, warmup + frames):
+        workload(lcd, frame)
+    lcd.sync()
+    cpu = time.process_time() - started
+
+    bus_time = transport.bus_time
+    stats = transport.stats.snapshot()
+    return {
+        'frames': frames,
+        'cpu_us_per_frame': 1e6 * cpu / frames,
+        'transfers_per_frame': transport.transfers / frames,
+        'transfers': {name: counters['transfers']
+                      for name, counters in stats.items()},
+        'bus_ms_per_frame': 1e3 * bus_time / frames,
+        'fps': frames / (cpu + bus_time) if cpu + bus_time else None,
+        'mismatches': hd44780sim.mismatches(lcd),
+    }
+
+
+def main(argv=None) -> int:
+    """Run the benchmarks and print or save the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=1000,
+                        help="frames per workload (default: %(default)s)")
+    parser.add_argument('--workload', action='append',
+                        choices=sorted(WORKLOADS),
+                        help="workload to run, may be repeated (default: all)")
+    parser.add_argument('--output', help="write the JSON results to a file")
+    args = parser.parse_args(argv)
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'workloads': {name: run(WORKLOADS[name], args.frames)
+                      for name in (args.workload or sorted(WORKLOADS))},
+    }
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    print(text)
+    return 1 if any(result['mismatches']
+                    for result in results['workloads'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
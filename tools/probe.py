@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Latency and reliability probe of the USB link to the LCD2USB.
+
+Sends thousands of echo requests (as LCD.echo does) with random 16 bit
+payloads, one after the other and then with several in flight at once, and
+checks that every one comes back unchanged. Prints the results as JSON, so
+a degraded cable or hub shows up as higher latency percentiles or a
+mismatch rate above zero:
+
+    python -m tools.probe --device --count 5000 --in-flight 8
+    python -m tools.probe --output probe.json
+
+Without --device it probes the simulated device, with the bus time of its
+transfers taken for real.
+"""
+
+import argparse
+import json
+import platform
+import random
+import struct
+import sys
+import threading
+import time
+
+import lcd2usb
+import hd44780sim
+
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def percentile(latencies, percent: float) -> float:
+    """Nearest-rank percentile of a sorted list of latencies."""
+    rank = max(int(len(latencies) * percent / 100.0 + 0.5), 1)
+    return latencies[min(rank, len(latencies)) - 1]
+
+
+def probe(transport, count: int, in_flight: int = 1, seed=None) -> dict:
+    """Echo `count` random payloads, `in_flight` at a time.
+
+    Each of `in_flight` threads sends its share of the echoes back to back,
+    so up to that many requests wait for the device at once. The latency of
+    an echo includes the time it waited behind the others. Failures are
+    counted, not printed, so the report stays the only output.
+
+    Returns
+    -------
+        (dict) counts of echoes, failures and mismatching answers, their
+        rates, the sustained transfers per second and the latency
+        percentiles in milliseconds.
+
+    """
+    rng = random.Random(seed)
+    payloads = [rng.getrandbits(16) for _ in range(count)]
+    latencies = []
+    counts = {'failures': 0, 'mismatches': 0}
+    lock = threading.Lock()
+
+    def worker(share):
+        timed = []
+        failures = mismatches = 0
+        for value in share:
+            started = time.perf_counter()
+            try:
+                data = transport.read(lcd2usb.LCD_ECHO, value)
+            except lcd2usb.USBError:
+                failures += 1
+                continue
+            finally:
+                timed.append(time.perf_counter() - started)
+            if bytes(data) != struct.pack('<H', value):
+                mismatches += 1
+        with lock:
+            latencies.extend(timed)
+            counts['failures'] += failures
+            counts['mismatches'] += mismatches
+
+    threads = [threading.Thread(target=worker,
+                                args=(payloads[start::in_flight],))
+               for start in range(in_flight)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    latencies.sort()
+    results = {
+        'echoes': count,
+        'in_flight': in_flight,
+        'seconds': seconds,
+        'transfers_per_second': count / seconds if seconds else None,
+        'failures': counts['failures'],
+        'mismatches': counts['mismatches'],
+        'failure_rate': counts['failures'] / count if count else 0.0,
+        'mismatch_rate': counts['mismatches'] / count if count else 0.0,
+    }
+    if latencies:
+        results['latency_ms'] = dict(
+            {'p{:g}'.format(percent): 1e3 * percentile(latencies, percent)
+             for percent in PERCENTILES},
+            min=1e3 * latencies[0], max=1e3 * latencies[-1],
+            mean=1e3 * sum(latencies) / len(latencies))
+    return results
+
+
+def main(argv=None) -> int:
+    """Probe the link and print or save the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=1000,
+                        help="echoes per run (default: %(default)s)")
+    parser.add_argument('--in-flight', type=int, default=8,
+                        help="echoes in flight at once in the second run "
+                             "(default: %(default)s)")
+    parser.add_argument('--device', action='store_true',
+                        help="probe the LCD2USB device instead of the "
+                             "simulator")
+    parser.add_argument('--seed', type=int,
+                        help="seed of the random payloads")
+    parser.add_argument('--output', help="write the JSON results to a file")
+    args = parser.parse_args(argv)
+    if args.count < 1 or args.in_flight < 1:
+        parser.error("--count and --in-flight must be positive")
+
+    if args.device:
+        # no ResilientTransport, retries would hide the failures to count
+        transport = lcd2usb.USBTransport(timeout=lcd2usb.TRANSFER_TIMEOUT)
+    else:
+        transport = hd44780sim.SimulatedTransport(realtime=True)
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'device': 'usb' if args.device else 'simulator',
+        'runs': {
+            'sync': probe(transport, args.count, 1, args.seed),
+            'in_flight': probe(transport, args.count, args.in_flight,
+                               args.seed),
+        },
+    }
+    transport.close()
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Replay a recorded USB transfer trace on the simulator or a device.
+
+Traces are recorded by passing trace= to lcd2usb.LCD, e.g. from the OHM
+screen with the LCD2USB_TRACE environment variable:
+
+    LCD2USB_TRACE=ohw.trace py -m win10py3lcd2usb
+    python -m tools.replay ohw.trace --speed max
+    python -m tools.replay ohw.trace --device
+
+Writes are sent again as recorded, reads are sent and their answers compared
+with the recorded ones. Prints the display contents left by the trace (on
+the simulator) and the transfer statistics of the replay.
+"""
+
+import argparse
+import sys
+import time
+
+import lcd2usb
+import hd44780sim
+
+
+def replay(records, transport, speed='original', max_gap=5.0) -> dict:
+    """Send the transfers of a trace through a transport.
+
+    At original speed the time between transfers is kept, except that gaps
+    longer than `max_gap` seconds (e.g. between appended recordings) are
+    shortened to it. At max speed the transfers are sent back to back.
+
+    Returns
+    -------
+        (dict) counts of transfers, failures and mismatching reads, and
+        the time the replay took.
+
+    """
+    results = {'transfers': 0, 'failures': 0, 'mismatches': 0}
+    started = time.perf_counter()
+    offset = 0.0  # time of the current record after started
+    previous = None
+    for record in records:
+        if speed == 'original':
+            if previous is not None:
+                offset += min(max(record.time - previous, 0.0), max_gap)
+            previous = record.time
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        results['transfers'] += 1
+        try:
+            if record.request_type & lcd2usb.ENDPOINT_IN:
+                data = transport.read(record.request, record.value,
+                                      record.index, record.length or 2)
+                if record.status == 0 and \
+                        int.from_bytes(bytes(data), 'little') != record.data:
+                    results['mismatches'] += 1
+            else:
+                transport.write(record.request, record.value, record.index)
+        except lcd2usb.USBError:
+            results['failures'] += 1
+    transport.sync()
+    results['seconds'] = time.perf_counter() - started
+    return results
+
+
+def main(argv=None) -> int:
+    """Replay a trace file and print what happened."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', help="trace file to replay")
+    parser.add_argument('--device', action='store_true',
+                        help="replay on the LCD2USB device instead of the "
+                             "simulator")
+    parser.add_argument('--speed', choices=('original', 'max'),
+                        default='original',
+                        help="keep the recorded timing or send as fast as "
+                             "possible (default: %(default)s)")
+    parser.add_argument('--max-gap', type=float, default=5.0,
+                        help="longest pause kept at original speed, in "
+                             "seconds (default: %(default)s)")
+    parser.add_argument('--geometry', choices=sorted(lcd2usb.GEOMETRIES),
+                        default='20x4',
+                        help="display of the simulator (default: "
+                             "%(default)s)")
+    args = parser.parse_args(argv)
+
+    geometry = lcd2usb.GEOMETRIES[args.geometry]
+    if args.device:
+        transport = lcd2usb.USBTransport()
+    else:
+        transport = hd44780sim.SimulatedTransport(
+            controllers=geometry.controllers)
+
+    results = replay(lcd2usb.read_trace(args.trace), transport, args.speed,
+                     args.max_gap)
+
+    print("{transfers} transfers in {seconds:.3f} s, {failures} failed, "
+          "{mismatches} reads answered differently".format(**results))
+    print("USB transfers:", transport.stats.summary())
+    if not args.device:
+        print("\n".join("|{}|".format(row)
+                        for row in transport.text(geometry)))
+    transport.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())